@@ -1,35 +1,98 @@
 import datetime
+import io
 import streamlit as st
 import pandas as pd
-from preprocessing.secondary_preprocess import preprocess
+from preprocessing.cache import get_code_version, get_data_version, load_preprocessed_data
+from preprocessing.ingestion import get_file_stat, get_files_hash
 import seaborn as sns
 import matplotlib.pyplot as plt
-import joblib
 import os
+import numpy as np
+import profiling
+from model_store import get_store
+from predictions.price_indexing import construction as price_index_construction
+from predictions.price_indexing import model as price_indexing_model
 from predictions.price_indexing.model import Model as PriceIndexingModel
+from predictions.price_indexing.artifact import ArtifactVersionError, load_model, read_artifact_metadata, save_model
 
 
 st.set_page_config(page_title='Мониторинг цен', layout='wide')
 
+DATA_PATH = 'ini_data/datamon.xlsx'
+PREPROCESSED_DATA_CACHE_PATH = 'cache/preprocessed_data.feather'
+MODEL_CACHE_PATH = 'cache/price_indexing_model.arrow'
+MODEL_DEPENDENCIES = [price_index_construction.__file__, price_indexing_model.__file__]
+DATA_COLUMNS = [
+    'cleaned_name', 'delivery_date', 'order_date', 'delivery_period', 'planned_delivery_period', 'region',
+    'amount', 'price', 'payment_conditions', 'out_of_plan', 'supplier', 'group'
+]
+
 
 def plot_price_changes(price_changes):
     fig, ax = plt.subplots()
     ax.set_title('Ежедневное изменение цен')
     sns.lineplot(data=price_changes, x='date', y='coef', ax=ax, color='black')
-    st.pyplot(fig)
+    return fig
 
 
 def plot_price_index(price_index):
     fig, ax = plt.subplots()
     ax.set_title('Индекс цен')
-    sns.lineplot(data=price_index, x='date', y='coef', ax=ax, color='black')
-    st.pyplot(fig)
-
-
-def predict_today_price_block(data, model: PriceIndexingModel):
-    names = data.sort_values('name', ascending=True)['name'].unique()
-    name = st.selectbox('Наименование', names)
-    name_df = data[data['name'] == name]
+    sns.lineplot(data=price_index.reset_index(), x='date', y='coef', ax=ax, color='black')
+    return fig
+
+
+def show_cached_chart(charts, key, plot):
+    """
+    Показывает график из кэша charts, отрисовывая его в PNG только при первом обращении
+
+    charts живет в снимке хранилища модели, поэтому пересоздается с новой версией модели.
+    """
+    if key not in charts:
+        fig = plot()
+        image = io.BytesIO()
+        fig.savefig(image, format='png', dpi=100, bbox_inches='tight')
+        plt.close(fig)
+        charts[key] = image.getvalue()
+    st.image(charts[key])
+
+
+def downsample_price_index(price_index, freq='W'):
+    """
+    Средние значения индекса по неделям для графика наименования
+    """
+    return price_index.resample(freq).mean()
+
+
+def build_name_view_index(data):
+    """
+    Границы строк и статистики наименований для data, отсортированного по "name"
+
+    Returns
+    -------
+    pandas.DataFrame
+        Колонки "start", "stop", "count", "min_price", "max_price", "group", "group_size" с индексом "name"
+    """
+    names = data['name'].values
+    starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]]) if len(names) else np.array([], dtype=int)
+    stops = np.r_[starts[1:], len(names)].astype(int)
+    prices = data['price'].values
+    groups = data['group'].values[starts]
+    return pd.DataFrame({
+        'start': starts,
+        'stop': stops,
+        'count': stops - starts,
+        'min_price': np.fmin.reduceat(prices, starts) if len(starts) else [],
+        'max_price': np.fmax.reduceat(prices, starts) if len(starts) else [],
+        'group': groups,
+        'group_size': pd.Series(groups, dtype=object).map(data['group'].value_counts()).fillna(0).astype(int).values,
+    }, index=pd.Index(names[starts], name='name'))
+
+
+def predict_today_price_block(data, model: PriceIndexingModel, name_view_index, price_index_weekly):
+    name = st.selectbox('Наименование', name_view_index.index)
+    name_stats = name_view_index.loc[name]
+    name_df = data.iloc[name_stats['start']:name_stats['stop']].copy()
 
     today = datetime.datetime.today().date()
     x = pd.DataFrame([{'order_date': today, 'name': name}])
@@ -51,15 +114,14 @@ def predict_today_price_block(data, model: PriceIndexingModel):
         'supplier': 'Поставщик',
         'group': 'Группа'
     }, axis=1)
-    name_df = name_df.drop(['calculated_order_date', 'has_order_date'], axis=1)
 
     st.dataframe(name_df)
     col1, col2 = st.columns(2)
     with col1:
         fig, ax = plt.subplots()
         ax.set_title('Индекс цен')
-        name_price_index = model.price_index.copy()
-        name_price_index['price'] =  name_price_index['coef'] * today_price / model.get_date_price_coef(today)
+        name_price_index = price_index_weekly * today_price / model.get_date_price_coef(today)
+        name_price_index = name_price_index.rename('price').reset_index()
         sns.lineplot(data=name_price_index, x='date', y='price', ax=ax, color='black')
         sns.scatterplot(data=pd.DataFrame([{'date': today, 'price': today_price}]),
                         x='date', y='price', ax=ax, color='black', s=50)
@@ -67,6 +129,7 @@ def predict_today_price_block(data, model: PriceIndexingModel):
         plt.ylabel('Цена, руб')
         plt.xlabel('Дата')
         st.pyplot(fig)
+        plt.close(fig)
     with col2:
         st.markdown('#### Статистические метрики')
         st.table(pd.DataFrame(index=[
@@ -77,60 +140,112 @@ def predict_today_price_block(data, model: PriceIndexingModel):
             'Количество измерений в группе'
         ],
             data={'': [
-                str(len(name_df)),
-                f"{name_df['Цена, руб'].min():,.02f} ₽".replace(',', ' '),
-                f"{name_df['Цена, руб'].max():,.02f} ₽".replace(',', ' '),
-                name_df.iloc[0]['Группа'],
-                str(len(data[data['group'] == name_df.iloc[0]['Группа']]))
+                str(name_stats['count']),
+                f"{name_stats['min_price']:,.02f} ₽".replace(',', ' '),
+                f"{name_stats['max_price']:,.02f} ₽".replace(',', ' '),
+                name_stats['group'],
+                str(name_stats['group_size'])
             ]}
         ))
 
 
-def model_page(data):
-
-    def reset_cache():
-        os.remove('cache/preprocessed_data.joblib')
-        os.remove('cache/price_indexing_model.joblib')
-
-    if os.path.exists('cache/preprocessed_data.joblib'):
-        data = joblib.load('cache/preprocessed_data.joblib')
-    else:
-        data = preprocess(data)
-        data = data[~data['order_date'].isna()]
-        data['name'] = data['cleaned_name'].apply(lambda x: x.capitalize())
-        data = data.drop(['cleaned_name'], axis=1)
-        outliers = {'редуктор 3572-05-11-000', 'подшипник седловой 3546-03-04-000-03', 'шпилька 3550-05-00-012-03'}
-        data = data[[name not in outliers for name in data['name']]]
-        data = data.sort_values(['name', 'order_date'])
-        data.index = list(range(len(data)))
-        joblib.dump(data, 'cache/preprocessed_data.joblib')
-
-    if os.path.exists('cache/price_indexing_model.joblib'):
-        try:
-            model = joblib.load('cache/price_indexing_model.joblib')
-        except Exception as exc:
-            st.error(exc)
-            reset_cache()
-            st.text('Reload the page')
-            return
-    else:
-        model = PriceIndexingModel()
-        model.fit(data.drop('price', axis=1), data['price'])
-        joblib.dump(model, 'cache/price_indexing_model.joblib')
-    with st.expander('Технические детали'):
-        col1, col2 = st.columns(2)
-        with col1:
-            plot_price_changes(model.daily_price_changes)
-        with col2:
-            plot_price_index(model.price_index)
-        st.button('Очистить кэш и пересчитать индекс', on_click=reset_cache)
-    with st.expander('Анализ по наименованию', expanded=True):
-        predict_today_price_block(data, model)
+def show_profiling_records(records):
+    st.download_button('Скачать замеры в JSON', profiling.to_json(records), file_name='profile.json', mime='application/json')
+    records = pd.DataFrame(records, columns=['stage', 'depth', 'rows', 'seconds', 'peak_memory_mb'])
+    records['stage'] = ['\xa0' * 4 * depth + stage for stage, depth in zip(records['stage'], records['depth'])]
+    st.markdown('#### Замеры этапов')
+    st.dataframe(records.drop('depth', axis=1).rename({
+        'stage': 'Этап',
+        'rows': 'Строк',
+        'seconds': 'Время, с',
+        'peak_memory_mb': 'Пик памяти, МБ'
+    }, axis=1))
+
+
+@profiling.profiled(stage='app.prepare_data')
+def prepare_data(data):
+    data = data[~data['order_date'].isna()]
+    data['name'] = data['cleaned_name'].apply(lambda x: x.capitalize())
+    data = data.drop(['cleaned_name'], axis=1)
+    outliers = {'редуктор 3572-05-11-000', 'подшипник седловой 3546-03-04-000-03', 'шпилька 3550-05-00-012-03'}
+    data = data[[name not in outliers for name in data['name']]]
+    data = data.sort_values(['name', 'order_date'])
+    data.index = list(range(len(data)))
+    return data
+
+
+def load_model_data(source_path, refresh=False):
+    """
+    Данные, индекс наименований и модель для хранилища model_store
+
+    При refresh кэши предобработки и модели пересчитываются заново.
+    Замеры загрузки сохраняются в "profiling_records".
+    """
+    with profiling.recording() as records:
+        data = load_preprocessed_data(source_path, PREPROCESSED_DATA_CACHE_PATH, columns=DATA_COLUMNS, refresh=refresh)
+        data = prepare_data(data)
+        data_version = get_data_version(PREPROCESSED_DATA_CACHE_PATH) + get_files_hash(MODEL_DEPENDENCIES)
+
+        model = None
+        warning = None
+        if not refresh and os.path.exists(MODEL_CACHE_PATH):
+            try:
+                metadata = read_artifact_metadata(MODEL_CACHE_PATH)
+                if metadata is not None and metadata.get('data_version') == data_version:
+                    model = load_model(MODEL_CACHE_PATH)
+            except ArtifactVersionError as exc:
+                warning = f'{exc} Индекс будет пересчитан.'
+        if model is None:
+            model = PriceIndexingModel()
+            model.fit(data.drop('price', axis=1), data['price'])
+            save_model(model, MODEL_CACHE_PATH, metadata=dict(data_version=data_version))
+        return dict(
+            profiling_records=records,
+            data=data,
+            name_view_index=build_name_view_index(data),
+            model=model,
+            price_index_weekly=downsample_price_index(model.price_index),
+            charts={},
+            warning=warning,
+        )
+
+
+def get_source_version(source_path):
+    return get_file_stat(source_path) + get_code_version() + get_files_hash(MODEL_DEPENDENCIES)
+
+
+def model_page(source_path):
+    with profiling.recording() as records:
+        store = get_store(
+            source_path,
+            load=lambda refresh: load_model_data(source_path, refresh),
+            get_version=lambda: get_source_version(source_path),
+        )
+        model_data = store.get()
+        data, model = model_data['data'], model_data['model']
+        if model_data['warning']:
+            st.warning(model_data['warning'])
+        if store.rebuilding:
+            st.info('Индекс пересчитывается в фоне. Показана предыдущая версия.')
+        if store.error is not None:
+            st.warning(f'Не удалось пересчитать индекс: {store.error}. Показана предыдущая версия.')
+        with st.expander('Технические детали'):
+            col1, col2 = st.columns(2)
+            with col1:
+                show_cached_chart(model_data['charts'], 'price_changes', lambda: plot_price_changes(model.daily_price_changes))
+            with col2:
+                show_cached_chart(model_data['charts'], 'price_index', lambda: plot_price_index(model.price_index))
+            st.button('Очистить кэш и пересчитать индекс', on_click=store.refresh, kwargs=dict(refresh_caches=True))
+            profiling_container = st.container()
+        with st.expander('Анализ по наименованию', expanded=True):
+            predict_today_price_block(data, model, model_data['name_view_index'], model_data['price_index_weekly'])
+        if profiling.ENABLED:
+            with profiling_container:
+                show_profiling_records(model_data['profiling_records'] + records)
 
 
 def main():
-    data = pd.read_excel('ini_data/datamon.xlsx')
-    model_page(data)
+    model_page(DATA_PATH)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,61 @@
+import json
+import re
+import time
+import pandas as pd
+from preprocessing.preprocess import assign_groups, preprocess_name
+from preprocessing.group_matching import GROUP_RULES_PATH
+from .name_normalization import with_missing_names
+from .synthetic import generate_raw_data
+
+
+def assign_groups_reference(df, group_rules):
+    # the original pass over all rows for every rule
+    df['Группа'] = None
+    for k, v in group_rules:
+        df.Группа = df.apply(
+            lambda r:
+            (v if v else k)
+            if (
+                    re.search(k, r.Наименование3)
+                    and re.search(k, r.Наименование3).start() == 0
+            )
+            else r.Группа,
+            axis=1
+        )
+    return df['Группа']
+
+
+def _load_group_rules():
+    with open(GROUP_RULES_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def check_equivalence(names):
+    # the reference fails on missing names, they must get no group
+    df = pd.DataFrame({'Наименование3': preprocess_name(names)})
+    present = df.Наименование3.notnull()
+    actual = assign_groups(df.Наименование3)
+    expected = assign_groups_reference(df[present].copy(), _load_group_rules())
+    pd.testing.assert_series_equal(actual[present], expected, check_names=False)
+    assert actual[~present].isnull().all()
+
+
+def run(sizes=(10_000, 100_000, 1_000_000), n_names=1000, reference_max_rows=10_000):
+    for size in sizes:
+        df = pd.DataFrame({'Наименование3': preprocess_name(generate_raw_data(size, n_names=n_names)['Наименование'])})
+        if size <= reference_max_rows:
+            start = time.perf_counter()
+            expected = assign_groups_reference(df.copy(), _load_group_rules())
+            print(f'{size} rows, reference: {time.perf_counter() - start:.03f} s')
+        start = time.perf_counter()
+        actual = assign_groups(df.Наименование3)
+        print(f'{size} rows, matcher: {time.perf_counter() - start:.03f} s')
+        if size <= reference_max_rows:
+            pd.testing.assert_series_equal(actual, expected, check_names=False)
+
+
+if __name__ == '__main__':
+    names = pd.read_excel('ini_data/datamon.xlsx')['Наименование']
+    check_equivalence(names)
+    check_equivalence(with_missing_names(names))
+    run()
@@ -0,0 +1,58 @@
+import re
+import time
+import pandas as pd
+from preprocessing.preprocess import preprocess_name
+from preprocessing.name_normalization import SUBSTITUTIONS_PATH, NameNormalizer
+from .synthetic import generate_raw_data
+
+
+def preprocess_name_reference(names, substitutions):
+    # the original cascade of full column passes
+    names = names.apply(
+        lambda s: s.lower().strip().replace("  ", "").replace('.', '-')
+    )
+    for k, v in substitutions:
+        names = names.apply(lambda s: re.sub(k, v, s))
+
+    return names
+
+
+def _load_substitutions():
+    return [
+        (pattern.pattern, replacement)
+        for pattern, replacement
+        in NameNormalizer.from_file(SUBSTITUTIONS_PATH).substitutions
+    ]
+
+
+def check_equivalence(names):
+    # the reference fails on missing names, they must stay missing
+    present = names.notnull()
+    actual = preprocess_name(names)
+    expected = preprocess_name_reference(names[present], _load_substitutions())
+    pd.testing.assert_series_equal(actual[present], expected)
+    assert actual[~present].isnull().all()
+
+
+def with_missing_names(names, step=100):
+    return names.where(pd.Series(range(len(names)), index=names.index) % step != step // 2)
+
+
+def run(sizes=(10_000, 100_000, 1_000_000), n_names=1000, reference_max_rows=100_000):
+    for size in sizes:
+        names = generate_raw_data(size, n_names=n_names)['Наименование']
+        if size <= reference_max_rows:
+            check_equivalence(with_missing_names(names))
+            start = time.perf_counter()
+            preprocess_name_reference(names, _load_substitutions())
+            print(f'{size} rows, reference: {time.perf_counter() - start:.03f} s')
+        start = time.perf_counter()
+        preprocess_name(names)
+        print(f'{size} rows, normalizer: {time.perf_counter() - start:.03f} s')
+
+
+if __name__ == '__main__':
+    names = pd.read_excel('ini_data/datamon.xlsx')['Наименование']
+    check_equivalence(names)
+    check_equivalence(with_missing_names(names))
+    run()
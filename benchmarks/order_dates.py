@@ -0,0 +1,58 @@
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+from preprocessing.preprocess import calculate_order_dates
+from .synthetic import generate_raw_data
+
+
+def calculate_order_dates_reference(df):
+    # the original row by row implementation
+    df['Расчетная дата заказа'] = None
+    df['Дата заказа фактическая'] = None
+    for i, r in df.iterrows():
+        if pd.notnull(r['Дата заказа']):
+            df.loc[i, 'Расчетная дата заказа'] = df.loc[i, 'Дата заказа']
+            df.loc[i, 'Дата заказа фактическая'] = True
+        elif pd.notnull(r['Дата поставки']) and pd.notnull(r['Плановый срок поставки']):
+            df.loc[i, 'Расчетная дата заказа'] = (
+                    df.loc[i, 'Дата поставки'] -
+                    timedelta(days=df.loc[i, 'Плановый срок поставки'])
+            )
+            df.loc[i, 'Дата заказа фактическая'] = False
+
+    return df
+
+
+def parse_delivery_dates(df):
+    df['Дата поставки'] = df['Дата поставки'].apply(
+        lambda s: datetime.strptime(s, '%d.%m.%Y') if isinstance(s, str) else s
+    )
+    return df
+
+
+def check_equivalence(df):
+    expected = calculate_order_dates_reference(df.copy())
+    actual = calculate_order_dates(df.copy())
+    pd.testing.assert_series_equal(
+        pd.to_datetime(actual['Расчетная дата заказа']),
+        pd.to_datetime(expected['Расчетная дата заказа'])
+    )
+    pd.testing.assert_series_equal(actual['Дата заказа фактическая'], expected['Дата заказа фактическая'])
+
+
+def run(sizes=(10_000, 100_000, 1_000_000), reference_max_rows=10_000):
+    for size in sizes:
+        df = parse_delivery_dates(generate_raw_data(size))
+        if size <= reference_max_rows:
+            check_equivalence(df)
+            start = time.perf_counter()
+            calculate_order_dates_reference(df.copy())
+            print(f'{size} rows, reference: {time.perf_counter() - start:.03f} s')
+        start = time.perf_counter()
+        calculate_order_dates(df.copy())
+        print(f'{size} rows, vectorized: {time.perf_counter() - start:.03f} s')
+
+
+if __name__ == '__main__':
+    check_equivalence(parse_delivery_dates(pd.read_excel('ini_data/datamon.xlsx')))
+    run()
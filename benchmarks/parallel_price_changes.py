@@ -0,0 +1,30 @@
+import time
+import numpy as np
+from predictions.price_indexing.construction import aggregate_and_get_price_changes
+from .price_index import get_index_data
+from .synthetic import generate_raw_data
+
+
+def check_equivalence(df, n_jobs):
+    _, expected, expected_names = aggregate_and_get_price_changes(df, 1)
+    _, actual, actual_names = aggregate_and_get_price_changes(df, n_jobs)
+    np.testing.assert_array_equal(actual, expected)
+    np.testing.assert_array_equal(actual_names, expected_names)
+
+
+def run(rows=2_000_000, n_names=50_000, workers=(1, 2, 4, 8, 16)):
+    df = get_index_data(generate_raw_data(rows, n_names=n_names))
+    for n_jobs in workers:
+        check_equivalence(df, n_jobs)
+        check_equivalence(df.iloc[:0], n_jobs)
+    base_time = None
+    for n_jobs in workers:
+        start = time.perf_counter()
+        aggregate_and_get_price_changes(df, n_jobs)
+        elapsed = time.perf_counter() - start
+        base_time = base_time or elapsed
+        print(f'{n_jobs} workers: {elapsed:.03f} s, speedup {base_time / elapsed:.02f}x')
+
+
+if __name__ == '__main__':
+    run()
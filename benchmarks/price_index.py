@@ -0,0 +1,131 @@
+import datetime
+import time
+import numpy as np
+import pandas as pd
+from predictions.price_indexing import construction
+from predictions.price_indexing.construction import (
+    MIN_DEFAULT_DATE, MAX_DEFAULT_DATE, _geometric_mean, build_price_index
+)
+from preprocessing.preprocess import preprocess_name
+from .synthetic import generate_raw_data
+
+
+def get_normalized_price_changes_reference(df):
+    # the original nested groupby over names and dates
+    price_changes = []
+    for name, name_df in df.groupby('name'):
+        aggregated_date_prices = []
+        for date, date_df in name_df.groupby('date'):
+            aggregated_date_prices.append((date, _geometric_mean(date_df['price'])))
+        name_price_df = pd.DataFrame(aggregated_date_prices, columns=['date', 'price'])
+        name_price_df = name_price_df.sort_values('date')
+        shift = (len(name_price_df) + 3) // 4
+        for (date_1, price_1), (date_2, price_2) in zip(name_price_df.values, name_price_df.values[shift:]):
+            min_interval = 15
+            if (date_2 - date_1).days < min_interval:
+                date_1 = date_2 - datetime.timedelta(days=min_interval)
+            price_changes.append((date_1, date_2, price_2 / price_1))
+    return price_changes
+
+
+def remove_outliers_reference(price_changes, outliers_percentile):
+    day_slopes = [coef ** (1.0 / (date_2 - date_1).days) for date_1, date_2, coef in price_changes]
+    left_percentile = np.percentile(day_slopes, outliers_percentile)
+    right_percentile = np.percentile(day_slopes, 100 - outliers_percentile)
+
+    return [
+        item
+        for item, day_slope
+        in zip(price_changes, day_slopes)
+        if day_slope > left_percentile and day_slope < right_percentile
+    ]
+
+
+def calculate_price_changes_by_dates_reference(price_changes):
+    day_coefs = []
+    for date_1, date_2, coef in price_changes:
+        days = (date_2 - date_1).days
+        day_coef = coef ** (1.0 / days)
+        for i in range(days):
+            cur_date = date_1 + datetime.timedelta(days=i)
+            day_coefs.append((cur_date, day_coef))
+    df = pd.DataFrame(day_coefs, columns=['date', 'coef'])
+    aggregated_coefs = []
+    for date, date_df in df.groupby('date'):
+        aggregated_coefs.append((date, _geometric_mean(date_df['coef'])))
+    df = pd.DataFrame(aggregated_coefs, columns=['date', 'coef'])
+    df = df.sort_values('date')
+
+    return df
+
+
+def convert_day_changes_to_index_reference(day_coefs, min_date, max_date):
+    average_day_coef = _geometric_mean(day_coefs['coef'])
+    day_coef_dict = {row['date']: row['coef'] for _, row in day_coefs.iterrows()}
+    cur_date = min_date
+    cur_coef = 1.0
+    result = []
+    while cur_date <= max_date:
+        result.append((cur_date, cur_coef))
+        cur_coef *= day_coef_dict.get(cur_date, average_day_coef)
+        cur_date = cur_date + datetime.timedelta(days=1)
+    return pd.DataFrame(result, columns=['date', 'coef'])
+
+
+def build_price_index_reference(df,
+                                min_date=MIN_DEFAULT_DATE,
+                                max_date=MAX_DEFAULT_DATE,
+                                outliers_percentile=0):
+    price_changes = get_normalized_price_changes_reference(df)
+    price_changes_without_outliers = remove_outliers_reference(price_changes, outliers_percentile)
+    daily_price_changes = calculate_price_changes_by_dates_reference(price_changes_without_outliers)
+    price_index = convert_day_changes_to_index_reference(daily_price_changes, min_date, max_date)
+    return dict(
+        price_index=price_index,
+        daily_price_changes=daily_price_changes
+    )
+
+
+def get_index_data(raw_data):
+    return pd.DataFrame({
+        'name': preprocess_name(raw_data['Наименование']),
+        'date': [t.date() for t in raw_data['Дата заказа']],
+        'price': raw_data['Цена, руб'],
+    }).dropna()
+
+
+def check_equivalence(df, outliers_percentile=8):
+    expected = build_price_index_reference(df, outliers_percentile=outliers_percentile)
+    actual = build_price_index(df, outliers_percentile=outliers_percentile)
+    assert list(actual['daily_price_changes']['date']) == list(expected['daily_price_changes']['date'])
+    np.testing.assert_allclose(actual['daily_price_changes']['coef'], expected['daily_price_changes']['coef'], rtol=1e-9)
+    assert list(actual['price_index'].index.date) == list(expected['price_index']['date'])
+    np.testing.assert_allclose(actual['price_index'].values, expected['price_index']['coef'], rtol=1e-9)
+
+
+def _time(title, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f'{title}: {time.perf_counter() - start:.03f} s')
+    return result
+
+
+def run(sizes=(10_000, 100_000, 1_000_000), n_names=1000, reference_max_rows=10_000):
+    for size in sizes:
+        df = get_index_data(generate_raw_data(size, n_names=n_names))
+        if size <= reference_max_rows:
+            price_changes_list = _time(f'{size} rows, reference price changes',
+                                       get_normalized_price_changes_reference, df)
+            _time(f'{size} rows, reference changes by dates',
+                  calculate_price_changes_by_dates_reference, price_changes_list)
+        price_changes = _time(f'{size} rows, price changes', construction.get_normalized_price_changes, df)
+        day_coefs = _time(f'{size} rows, changes by dates', construction.calculate_price_changes_by_dates, price_changes)
+        if size <= reference_max_rows:
+            _time(f'{size} rows, reference index', convert_day_changes_to_index_reference,
+                  day_coefs, MIN_DEFAULT_DATE, MAX_DEFAULT_DATE)
+        _time(f'{size} rows, index', construction.convert_day_changes_to_index, day_coefs)
+
+
+if __name__ == '__main__':
+    check_equivalence(get_index_data(pd.read_excel('ini_data/datamon.xlsx')))
+    run()
@@ -0,0 +1,91 @@
+import time
+import numpy as np
+import pandas as pd
+from predictions.price_indexing.construction import GLOBAL_INDEX, build_price_index, build_price_indices
+from predictions.price_indexing.model import OUTLIERS_PERCENTILE, Model
+from preprocessing.secondary_preprocess import preprocess
+from .synthetic import generate_raw_data
+
+
+def check_partial_fit_equivalence(data, prefix=0.8, **params):
+    # fit on the earliest orders, partial_fit on the rest, compare with fit on all of them
+    data = data[~data['order_date'].isna()].sort_values('order_date', kind='stable')
+    old_data = data.iloc[:int(len(data) * prefix)]
+    new_data = data.iloc[int(len(data) * prefix):]
+    x = data.drop('price', axis=1)
+
+    expected = Model(**params)
+    expected.fit(x, data['price'])
+    actual = Model(**params)
+    actual.fit(old_data.drop('price', axis=1), old_data['price'])
+    actual.partial_fit(new_data.drop('price', axis=1), new_data['price'])
+    np.testing.assert_allclose(actual.price_index.values, expected.price_index.values, rtol=1e-9)
+    np.testing.assert_allclose(actual.predict(x), expected.predict(x), rtol=1e-9)
+
+
+def predict_reference(data, price_index):
+    # base price of a name is the geometric mean of its prices divided by the index
+    coefs = price_index.reindex(pd.to_datetime(data['order_date'])).values
+    base_prices = np.exp((np.log(data['price']) - np.log(coefs)).groupby(data['name']).mean())
+    return data['name'].map(base_prices).values * coefs
+
+
+def check_keyed_equivalence(data, index_keys=('group', 'region'), min_index_segments=50):
+    data = data[~data['order_date'].isna()]
+    x = data.drop('price', axis=1)
+    index_data = data.rename({'order_date': 'date'}, axis=1)
+    expected = build_price_index(index_data[['name', 'date', 'price']], outliers_percentile=OUTLIERS_PERCENTILE)
+
+    # the global row of the keyed build is the plain index
+    indices = build_price_indices(index_data, index_keys, outliers_percentile=OUTLIERS_PERCENTILE)
+    pd.testing.assert_frame_equal(indices['daily_price_changes'][GLOBAL_INDEX], expected['daily_price_changes'],
+                                  check_exact=False, rtol=1e-12)
+    np.testing.assert_allclose(indices['price_indices'][GLOBAL_INDEX].values, expected['price_index'].values,
+                               rtol=1e-9)
+
+    # without index_keys the model predicts by the plain index
+    plain = Model()
+    plain.fit(x, data['price'])
+    np.testing.assert_allclose(plain.price_index.values, expected['price_index'].values, rtol=1e-9)
+    np.testing.assert_allclose(plain.predict(x), predict_reference(data, expected['price_index']), rtol=1e-9)
+
+    # keyed indices are those of build_price_indices, with no usable ones the model falls back to the plain index
+    keyed = Model(index_keys=index_keys, min_index_segments=min_index_segments)
+    keyed.fit(x, data['price'])
+    for label, price_index in keyed.price_indices.items():
+        np.testing.assert_allclose(price_index.values, indices['price_indices'][label].values, rtol=1e-9)
+    unusable = Model(index_keys=index_keys, min_index_segments=np.inf)
+    unusable.fit(x, data['price'])
+    np.testing.assert_allclose(unusable.predict(x), plain.predict(x), rtol=1e-9)
+
+
+def run(rows=300_000, n_names=10_000):
+    data = preprocess(generate_raw_data(rows, n_names=n_names))
+    data = data[~data['order_date'].isna()]
+    train_data = data.iloc[:len(data) // 2]
+    test_data = data.iloc[len(data) // 2:]
+
+    model = Model()
+    start = time.perf_counter()
+    model.fit(train_data.drop('price', axis=1), train_data['price'])
+    print(f'fit on {len(train_data)} rows: {time.perf_counter() - start:.03f} s')
+    start = time.perf_counter()
+    model.predict(test_data.drop('price', axis=1))
+    print(f'predict of {len(test_data)} rows: {time.perf_counter() - start:.03f} s')
+
+    last_date = train_data['order_date'].max()
+    old_data = train_data[train_data['order_date'] < last_date]
+    new_data = train_data[train_data['order_date'] == last_date]
+    model.fit(old_data.drop('price', axis=1), old_data['price'])
+    start = time.perf_counter()
+    model.partial_fit(new_data.drop('price', axis=1), new_data['price'])
+    print(f'partial fit on {len(new_data)} rows of the last day: {time.perf_counter() - start:.03f} s')
+
+
+if __name__ == '__main__':
+    datamon = preprocess(pd.read_excel('ini_data/datamon.xlsx'))
+    check_partial_fit_equivalence(datamon)
+    check_partial_fit_equivalence(preprocess(generate_raw_data(100_000, n_names=5000)))
+    check_keyed_equivalence(datamon)
+    check_partial_fit_equivalence(datamon, index_keys=('group', 'region'), min_index_segments=50)
+    run()
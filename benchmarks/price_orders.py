@@ -0,0 +1,88 @@
+import datetime
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from predictions.price_indexing.artifact import save_model
+from predictions.price_indexing.model import Model
+from prediction_service import get_model_names
+from preprocessing.secondary_preprocess import preprocess
+from price_orders import PRICE_COLUMN, price_orders
+from .synthetic import generate_raw_data
+
+
+DEFAULT_DATE = datetime.date(2021, 6, 1)
+
+
+def fit_model(model_path, rows=50_000, n_names=2000):
+    data = preprocess(generate_raw_data(rows, n_names=n_names))
+    data = data[~data['order_date'].isna()]
+    data['name'] = get_model_names(data['name']).values
+    model = Model()
+    model.fit(data.drop('price', axis=1), data['price'])
+    save_model(model, model_path)
+    return model
+
+
+def get_orders(rows, n_names=2000, comment_row=None):
+    raw_data = generate_raw_data(rows, n_names=n_names)
+    orders = pd.DataFrame({
+        'Наименование': raw_data['Наименование'].values,
+        'Дата заказа': pd.to_datetime(raw_data['Дата заказа']).dt.strftime('%d.%m.%Y').values,
+        'Комментарий': None,
+    })
+    # a column that is empty in the first chunks and has text later
+    if comment_row is not None:
+        orders.loc[comment_row, 'Комментарий'] = 'срочно'
+    return orders
+
+
+def _write_orders(orders, path):
+    if path.endswith('.csv'):
+        orders.to_csv(path, index=False)
+    else:
+        orders.to_parquet(path, index=False)
+
+
+def _read_result(path):
+    return pd.read_csv(path, dtype={'Комментарий': str}) if path.endswith('.csv') else pd.read_parquet(path)
+
+
+def check_equivalence(model, model_path, orders, chunk_size=1000, n_jobs=1):
+    dates = pd.to_datetime(orders['Дата заказа'], format='%d.%m.%Y').fillna(pd.Timestamp(DEFAULT_DATE))
+    names = get_model_names(orders['Наименование'].astype(str)).values
+    expected = model.predict(pd.DataFrame({'name': names, 'cleaned_name': names, 'order_date': dates.values}))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for input_format in ('csv', 'parquet'):
+            input_path = os.path.join(tmp_dir, f'orders.{input_format}')
+            _write_orders(orders, input_path)
+            for output_format in ('csv', 'parquet'):
+                output_path = os.path.join(tmp_dir, f'priced.{output_format}')
+                rows = price_orders(input_path, output_path, model_path, default_date=DEFAULT_DATE,
+                                    chunk_size=chunk_size, n_jobs=n_jobs, progress=None)
+                result = _read_result(output_path)
+                assert rows == len(orders) == len(result)
+                np.testing.assert_allclose(result[PRICE_COLUMN], expected, rtol=1e-12)
+                assert list(result['Комментарий'].fillna('')) == list(orders['Комментарий'].fillna(''))
+
+
+def run(rows=500_000, workers=(1, 2, 4), chunk_size=50_000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, 'model.arrow')
+        model = fit_model(model_path)
+        check_equivalence(model, model_path, get_orders(10_000, comment_row=2500))
+        check_equivalence(model, model_path, get_orders(10_000, comment_row=2500), n_jobs=2)
+
+        input_path = os.path.join(tmp_dir, 'orders.csv')
+        _write_orders(get_orders(rows), input_path)
+        for n_jobs in workers:
+            start = time.perf_counter()
+            price_orders(input_path, os.path.join(tmp_dir, 'priced.parquet'), model_path, default_date=DEFAULT_DATE,
+                         chunk_size=chunk_size, n_jobs=n_jobs, progress=None)
+            elapsed = time.perf_counter() - start
+            print(f'{rows} rows, {n_jobs} workers: {elapsed:.03f} s, {rows / elapsed:,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,104 @@
+"""
+Нагрузочный тест prediction_service
+
+    python -m prediction_service &
+    python -m benchmarks.service_load --connections 16 --duration 10 --batch-size 1000
+
+Каждое соединение отправляет запросы подряд по keep-alive. Наименования
+берутся из модели, даты - случайные в пределах последних лет.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import time
+import urllib.parse
+import numpy as np
+from predictions.price_indexing.artifact import load_model
+from prediction_service import DEFAULT_MODEL_PATH
+
+
+async def _request(reader, writer, method, target, body=b''):
+    writer.write(
+        f'{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b'\r\n':
+            break
+        key, _, value = line.decode('latin-1').partition(':')
+        if key.lower() == 'content-length':
+            length = int(value)
+    payload = await reader.readexactly(length)
+    if status != 200:
+        raise RuntimeError(f'{status}: {payload.decode()}')
+    return json.loads(payload)
+
+
+async def _client(host, port, names, batch_size, deadline, latencies, rng):
+    reader, writer = await asyncio.open_connection(host, port)
+    today = datetime.date.today()
+    try:
+        while time.perf_counter() < deadline:
+            dates = [today - datetime.timedelta(days=int(days)) for days in rng.integers(0, 5 * 365, batch_size)]
+            batch_names = rng.choice(names, batch_size)
+            start = time.perf_counter()
+            if batch_size == 1:
+                query = urllib.parse.urlencode(dict(name=batch_names[0], date=dates[0].isoformat()))
+                await _request(reader, writer, 'GET', f'/predict?{query}')
+            else:
+                body = json.dumps(dict(items=[
+                    dict(name=name, date=date.isoformat()) for name, date in zip(batch_names, dates)
+                ])).encode()
+                await _request(reader, writer, 'POST', '/predict/batch', body)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_load(host='127.0.0.1', port=8080, model_path=DEFAULT_MODEL_PATH,
+                   connections=16, duration=10.0, batch_size=1, seed=0):
+    names = load_model(model_path).name_base_prices.index.values
+    rng = np.random.default_rng(seed)
+    latencies = []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*[
+        _client(host, port, names, batch_size, deadline, latencies, np.random.default_rng(rng.integers(1 << 32)))
+        for _ in range(connections)
+    ])
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return dict(
+        requests=len(latencies),
+        requests_per_second=len(latencies) / elapsed,
+        rows_per_second=len(latencies) * batch_size / elapsed,
+        p50_ms=float(np.percentile(latencies, 50)),
+        p99_ms=float(np.percentile(latencies, 99)),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест prediction_service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='артефакт, из которого берутся наименования')
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help='секунды')
+    parser.add_argument('--batch-size', type=int, default=1, help='1 - GET /predict, больше - POST /predict/batch')
+    args = parser.parse_args()
+    result = asyncio.run(run_load(
+        args.host, args.port, args.model, args.connections, args.duration, args.batch_size
+    ))
+    print(
+        f"{result['requests']} requests, {result['requests_per_second']:.01f} req/s, "
+        f"{result['rows_per_second']:.01f} rows/s, "
+        f"p50 {result['p50_ms']:.02f} ms, p99 {result['p99_ms']:.02f} ms"
+    )
+
+
+if __name__ == '__main__':
+    main()
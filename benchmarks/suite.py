@@ -0,0 +1,165 @@
+"""
+Замеры времени всех этапов конвейера на синтетических данных
+
+    python -m benchmarks.suite --rows 100000 --names 5000 --output benchmark_results.json
+
+Результаты пишутся в JSON вместе с коммитом и параметрами запуска,
+чтобы сравнивать их между коммитами.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from predictions.price_indexing.construction import (
+    build_price_index,
+    calculate_price_changes_by_dates,
+    convert_day_changes_to_index,
+    get_normalized_price_changes,
+    remove_outliers,
+)
+from preprocessing.preprocess import assign_groups, calculate_order_dates, preprocess_name
+from preprocessing.secondary_preprocess import preprocess
+from scoring.benchmark import get_default_models
+from .order_dates import parse_delivery_dates
+from .synthetic import generate_raw_data
+
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_START_SCRIPT = '''
+import app
+app.load_model_data(app.DATA_PATH)
+'''
+
+
+class Timings:
+
+    def __init__(self):
+        self.results = []
+
+    def measure(self, stage, rows, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        self.results.append(dict(stage=stage, rows=rows, seconds=seconds))
+        print(f'{stage}:' + (f' {rows} rows,' if rows is not None else '') + f' {seconds:.03f} s')
+        return result
+
+
+def _get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=PACKAGE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _start_app(working_dir):
+    subprocess.run(
+        [sys.executable, '-c', APP_START_SCRIPT],
+        cwd=working_dir,
+        env=dict(os.environ, PYTHONPATH=PACKAGE_DIR),
+        check=True,
+    )
+
+
+def time_app_start(timings):
+    """
+    Загрузка данных и модели app.py в новом процессе на "ini_data/datamon.xlsx":
+    сначала без кэшей, затем с кэшами первого запуска
+    """
+    with tempfile.TemporaryDirectory() as working_dir:
+        os.symlink(os.path.join(PACKAGE_DIR, 'ini_data'), os.path.join(working_dir, 'ini_data'))
+        timings.measure('app cold start', None, _start_app, working_dir)
+        timings.measure('app warm start', None, _start_app, working_dir)
+
+
+def run(rows=100_000,
+        n_names=5000,
+        min_date=datetime.date(2015, 1, 1),
+        max_date=datetime.date(2021, 12, 31),
+        name_variety=0.1,
+        models=None,
+        app=True,
+        output='benchmark_results.json'):
+    timings = Timings()
+    raw_data = timings.measure(
+        'generate_raw_data', rows, generate_raw_data, rows, n_names, min_date, max_date, name_variety
+    )
+
+    cleaned_names = timings.measure('preprocess_name', rows, preprocess_name, raw_data['Наименование'])
+    timings.measure('assign_groups', rows, assign_groups, cleaned_names)
+    timings.measure('calculate_order_dates', rows, calculate_order_dates, parse_delivery_dates(raw_data.copy()))
+    data = timings.measure('preprocess', rows, preprocess, raw_data)
+    data = data[~data['order_date'].isna()]
+
+    index_data = data[['name', 'order_date', 'price']].rename({'order_date': 'date'}, axis=1)
+    price_changes = timings.measure(
+        'get_normalized_price_changes', len(index_data), get_normalized_price_changes, index_data
+    )
+    inlier_price_changes = timings.measure(
+        'remove_outliers', len(price_changes), remove_outliers, price_changes, 8
+    )
+    daily_price_changes = timings.measure(
+        'calculate_price_changes_by_dates', len(inlier_price_changes),
+        calculate_price_changes_by_dates, inlier_price_changes
+    )
+    timings.measure(
+        'convert_day_changes_to_index', len(daily_price_changes), convert_day_changes_to_index, daily_price_changes
+    )
+    timings.measure('build_price_index', len(index_data), build_price_index, index_data, outliers_percentile=8)
+
+    train_data = data.iloc[:len(data) // 2]
+    test_data = data.iloc[len(data) // 2:]
+    for title, model in get_default_models().items():
+        if models is not None and title not in models:
+            continue
+        timings.measure(f'{title} fit', len(train_data), model.fit, train_data.drop('price', axis=1), train_data['price'])
+        timings.measure(f'{title} predict', len(test_data), model.predict, test_data.drop('price', axis=1))
+
+    if app:
+        time_app_start(timings)
+
+    report = dict(
+        commit=_get_commit(),
+        created_at=datetime.datetime.now().isoformat(timespec='seconds'),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        parameters=dict(
+            rows=rows,
+            n_names=n_names,
+            min_date=min_date.isoformat(),
+            max_date=max_date.isoformat(),
+            name_variety=name_variety,
+        ),
+        results=timings.results,
+    )
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры времени этапов конвейера на синтетических данных')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--names', type=int, default=5000)
+    parser.add_argument('--min-date', type=datetime.date.fromisoformat, default=datetime.date(2015, 1, 1))
+    parser.add_argument('--max-date', type=datetime.date.fromisoformat, default=datetime.date(2021, 12, 31))
+    parser.add_argument('--name-variety', type=float, default=0.1,
+                        help='доля записей с другим написанием наименования')
+    parser.add_argument('--models', nargs='*', help='модели из scoring.benchmark.get_default_models, по умолчанию все')
+    parser.add_argument('--no-app', action='store_true', help='не замерять запуск app.py')
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+    run(args.rows, args.names, args.min_date, args.max_date, args.name_variety, args.models, not args.no_app, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import datetime
+import numpy as np
+import pandas as pd
+
+
+NAME_PREFIXES = [
+    'ВТУЛКА', 'Втулка', 'ЗУБ КОВША', 'Зуб', 'Блок', 'БЛОК ГОЛОВНОЙ', 'Вал-шестерня', 'Венец зубчатый',
+    'Муфта ТРМЗ', 'Подвеска', 'Подшипник', 'Коромысло', 'ЗАСОВ ДНИЩА', 'Лестница', 'Шкив', 'Стрела',
+]
+REGIONS = ['Республика Карелия', 'Мурманская область', 'Вологодская область']
+PAYMENT_CONDITIONS = [
+    'ПОСЛЕДУЮЩАЯ ОПЛАТА 100% в течение 30 дней с даты ППС ДЕНЬГИ 100%',
+    'ПОСЛЕДУЮЩАЯ ОПЛАТА 100% в течение 45 дней с даты ППС ДЕНЬГИ 100%',
+    'ПОСЛЕДУЮЩАЯ ОПЛАТА 100% в течение 60 дней с даты ППС ДЕНЬГИ 100%',
+]
+# ways the export spells the same name differently
+NAME_VARIANTS = [
+    lambda names: names.str.upper(),
+    lambda names: names.str.lower(),
+    lambda names: names + ' ',
+    lambda names: names.str.replace(' ', '  ', n=1, regex=False),
+    lambda names: names.str.replace(' ', '', n=1, regex=False),
+    lambda names: names + ', с наплавкой',
+]
+
+
+def generate_names(n_names, seed=0):
+    rng = np.random.default_rng(seed)
+    prefixes = rng.choice(NAME_PREFIXES, n_names)
+    codes = rng.integers(1000, 4000, n_names)
+    parts = rng.integers(0, 100, (n_names, 3))
+    return [
+        f'{prefix} {code}.{a:02d}.{b:02d}.{c:03d}'
+        for prefix, code, (a, b, c)
+        in zip(prefixes, codes, parts)
+    ]
+
+
+def generate_raw_data(n_rows,
+                      n_names=1000,
+                      min_date=datetime.date(2015, 1, 1),
+                      max_date=datetime.date(2021, 12, 31),
+                      name_variety=0.0,
+                      seed=0):
+    """
+    Генерирует закупки в формате "ini_data/datamon.xlsx"
+
+    Parameters
+    ----------
+    n_rows : int
+        Количество записей
+    n_names : int
+        Количество наименований
+    min_date, max_date : datetime.date
+        Период дат заказа
+    name_variety : float
+        Доля записей, в которых наименование записано одним из вариантов NAME_VARIANTS
+    seed : int
+        Начальное значение генератора случайных чисел
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array(generate_names(n_names, seed))
+    name_ids = rng.integers(0, n_names, n_rows)
+    base_prices = np.exp(rng.uniform(np.log(1e3), np.log(1e6), n_names))
+
+    days = (max_date - min_date).days
+    order_dates = pd.Timestamp(min_date) + pd.to_timedelta(rng.integers(0, days, n_rows), unit='D')
+    delivery_periods = rng.integers(1, 300, n_rows).astype(float)
+    planned_delivery_periods = rng.choice([45.0, 60.0, 90.0, 120.0, 180.0], n_rows)
+    delivery_dates = order_dates + pd.to_timedelta(delivery_periods, unit='D')
+    years = (order_dates - pd.Timestamp(min_date)).days.values / 365
+    prices = base_prices[name_ids] * 1.05 ** years * np.exp(rng.normal(0, 0.1, n_rows))
+
+    # the export misses order dates and mixes formats of delivery dates
+    without_order_date = rng.random(n_rows) < 0.25
+    delivery_dates_as_str = rng.random(n_rows) < 0.2
+    without_delivery_date = rng.random(n_rows) < 0.005
+    without_planned_period = rng.random(n_rows) < 0.005
+
+    delivery_date_values = pd.Series(delivery_dates.to_pydatetime(), dtype=object)
+    delivery_date_values[delivery_dates_as_str] = delivery_dates[delivery_dates_as_str].strftime('%d.%m.%Y')
+    delivery_date_values[without_delivery_date] = np.nan
+    planned_delivery_periods[without_planned_period] = np.nan
+    order_date_values = pd.Series(order_dates).where(~without_order_date)
+    delivery_periods[without_order_date] = np.nan
+
+    row_names = pd.Series(names[name_ids])
+    if name_variety > 0:
+        variants = np.where(rng.random(n_rows) < name_variety, rng.integers(0, len(NAME_VARIANTS), n_rows), -1)
+        for variant, make_variant in enumerate(NAME_VARIANTS):
+            selected = variants == variant
+            row_names[selected] = make_variant(row_names[selected])
+
+    return pd.DataFrame({
+        'Наименование': row_names.values,
+        'Дата поставки': delivery_date_values,
+        'Дата заказа': order_date_values,
+        'Срок поставки': delivery_periods,
+        'Плановый срок поставки': planned_delivery_periods,
+        'Регион': rng.choice(REGIONS, n_rows),
+        'Объем заказа': rng.integers(1, 10, n_rows),
+        'Цена, руб': prices,
+        'Условия платежа': rng.choice(PAYMENT_CONDITIONS + [np.nan], n_rows),
+        'НРП - нерегламентная потребность (внеплановая закупка)': np.where(rng.random(n_rows) < 0.1, 1.0, np.nan),
+        'Поставщик': rng.integers(3600, 4100, n_rows),
+    })
@@ -0,0 +1,94 @@
+"""
+Общие для всех сессий Streamlit данные и модель
+
+Модуль импортируется один раз на процесс сервера, поэтому хранилища
+живут между перезапусками скрипта и разделяются сессиями. Значение
+хранилища только читается, пересборка идет в фоновом потоке и подменяет
+его одной операцией присваивания.
+"""
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class ModelStore:
+    """
+    Значение load(), пересобираемое при изменении get_version()
+
+    Parameters
+    ----------
+    load : callable
+        load(refresh) возвращает значение хранилища, refresh - пересчитать без файловых кэшей
+    get_version : callable
+        Быстрая проверка версии источников, например по размеру и времени изменения файлов
+    """
+
+    def __init__(self, load, get_version):
+        self._load = load
+        self._get_version = get_version
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._thread = None
+        self._failed_version = None
+        self.error = None
+
+    @property
+    def rebuilding(self):
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def get(self):
+        """
+        Текущее значение
+
+        Первый вызов ждет загрузки. Если источники изменились, запускает
+        пересборку в фоне и сразу возвращает прежнее значение.
+        """
+        version = self._get_version()
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = (version, self._load(False))
+                snapshot = self._snapshot
+        elif snapshot[0] != version and version != self._failed_version:
+            self.refresh()
+        return snapshot[1]
+
+    def refresh(self, refresh_caches=False):
+        """
+        Запускает фоновую пересборку, если она еще не идет
+        """
+        with self._lock:
+            if self.rebuilding:
+                return
+            self._thread = threading.Thread(target=self._rebuild, args=(refresh_caches,), daemon=True)
+            self._thread.start()
+
+    def _rebuild(self, refresh_caches):
+        version = self._get_version()
+        try:
+            value = self._load(refresh_caches)
+        except Exception as exc:
+            logger.exception('Model store rebuild failed, keeping the previous version')
+            self._failed_version = version
+            self.error = exc
+            return
+        self._snapshot = (version, value)
+        self._failed_version = None
+        self.error = None
+
+
+def get_store(key, load, get_version):
+    """
+    Хранилище процесса для ключа, создается при первом обращении
+    """
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ModelStore(load, get_version)
+        return _stores[key]
@@ -0,0 +1,224 @@
+"""
+HTTP-сервис прогноза цен без интерфейса
+
+    python -m prediction_service --model cache/price_indexing_model.arrow --port 8080
+
+Модель индексации цен загружается один раз из артефакта, который сохраняет app.py.
+Наименования приводятся к виду, на котором обучена модель: preprocess_name
+и заглавная первая буква, как в app.prepare_data.
+
+    GET  /health
+    GET  /predict?name=<наименование>&date=<гггг-мм-дд>     дата по умолчанию - сегодня
+    POST /predict/batch  {"items": [{"name": ..., "date": ...}, ...]}
+
+Ответы - JSON, цена null для неизвестных наименований и дат вне индекса.
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import logging
+import threading
+import urllib.parse
+import numpy as np
+import pandas as pd
+from predictions.price_indexing.artifact import load_model
+from preprocessing.preprocess import preprocess_name
+
+
+DEFAULT_MODEL_PATH = 'cache/price_indexing_model.arrow'
+DEFAULT_CACHE_SIZE = 100_000
+MAX_BODY_SIZE = 64 * 2 ** 20
+_MISSING = object()
+
+logger = logging.getLogger(__name__)
+
+
+class RequestError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def get_model_names(names):
+    """
+    Наименования в том виде, на котором обучается модель в app.py
+    """
+    return preprocess_name(pd.Series(names, dtype=object)).str.capitalize()
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key in self._items:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class PricePredictor:
+    """
+    Прогнозы модели с LRU-кэшем по (наименование, дата)
+
+    Промахи кэша прогнозируются одним вызовом model.predict на весь запрос.
+    Можно вызывать из нескольких потоков.
+    """
+
+    def __init__(self, model, cache_size=DEFAULT_CACHE_SIZE):
+        self.model = model
+        self.cache = LRUCache(cache_size)
+        self._lock = threading.Lock()
+
+    def predict(self, names, dates):
+        keys = list(zip(names, dates))
+        with self._lock:
+            prices = [self.cache.get(key, _MISSING) for key in keys]
+        missing = [i for i, price in enumerate(prices) if price is _MISSING]
+        if missing:
+            x = pd.DataFrame({
+                'name': get_model_names([names[i] for i in missing]).values,
+                'order_date': [dates[i] for i in missing],
+            })
+            predicted = [None if np.isnan(price) else float(price) for price in self.model.predict(x)]
+            with self._lock:
+                for i, price in zip(missing, predicted):
+                    self.cache.put(keys[i], price)
+                    prices[i] = price
+        return prices
+
+
+def _parse_date(value):
+    if value is None:
+        return datetime.date.today()
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise RequestError(400, f'Invalid date {value!r}, expected YYYY-MM-DD')
+
+
+def _parse_batch(body):
+    try:
+        items = json.loads(body)['items']
+        names = [item['name'] for item in items]
+        dates = [item.get('date') for item in items]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise RequestError(400, 'Expected JSON {"items": [{"name": ..., "date": ...}, ...]}')
+    if not all(isinstance(name, str) for name in names):
+        raise RequestError(400, 'Names must be strings')
+    return names, [_parse_date(date) for date in dates]
+
+
+class PredictionServer:
+
+    def __init__(self, predictor):
+        self.predictor = predictor
+
+    async def predict(self, names, dates):
+        # промахи кэша считаются pandas и моделью, они не должны блокировать цикл событий
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.predictor.predict, names, dates)
+
+    async def handle(self, method, target, body):
+        url = urllib.parse.urlsplit(target)
+        if method == 'GET' and url.path == '/health':
+            return dict(
+                status='ok',
+                names=len(self.predictor.model.name_base_prices),
+                cache_size=len(self.predictor.cache),
+                cache_hits=self.predictor.cache.hits,
+                cache_misses=self.predictor.cache.misses,
+            )
+        if method == 'GET' and url.path == '/predict':
+            query = urllib.parse.parse_qs(url.query)
+            if 'name' not in query:
+                raise RequestError(400, 'Missing name')
+            name, date = query['name'][0], _parse_date(query.get('date', [None])[0])
+            price, = await self.predict([name], [date])
+            return dict(name=name, date=date.isoformat(), price=price)
+        if method == 'POST' and url.path == '/predict/batch':
+            names, dates = _parse_batch(body)
+            return dict(prices=await self.predict(names, dates))
+        raise RequestError(404, f'No route for {method} {url.path}')
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_SIZE:
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    status, response = 200, await self.handle(method, target, body)
+                except RequestError as exc:
+                    status, response = exc.status, dict(error=str(exc))
+                except Exception:
+                    logger.exception('Failed to handle %s %s', method, target)
+                    status, response = 500, dict(error='Internal error')
+                payload = json.dumps(response, ensure_ascii=False).encode()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+                    f'Content-Type: application/json; charset=utf-8\r\n'
+                    f'Content-Length: {len(payload)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(model_path=DEFAULT_MODEL_PATH, host='127.0.0.1', port=8080, cache_size=DEFAULT_CACHE_SIZE):
+    server = PredictionServer(PricePredictor(load_model(model_path), cache_size))
+    async with await asyncio.start_server(server.serve_connection, host, port) as http_server:
+        logger.info('Serving %s on %s:%s', model_path, host, port)
+        await http_server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP-сервис прогноза цен')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='артефакт модели индексации цен')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(args.model, args.host, args.port, args.cache_size))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,7 @@
 from sklearn.base import BaseEstimator, RegressorMixin
 import numpy as np
-
-
-def _geometric_mean(x):
-    return np.exp(np.log(x).mean())
+import pandas as pd
+from profiling import profiled
 
 
 class Model(BaseEstimator, RegressorMixin):
@@ -12,23 +10,20 @@ class Model(BaseEstimator, RegressorMixin):
         self.name_predictions = None
         self.mean_kind = mean_kind
 
+    @profiled
     def fit(self, x, y):
-        data = x.copy()
-        data['price'] = y
-        self.name_predictions = {}
-        for name, df in data.groupby('name'):
-            if self.mean_kind == 'geometric':
-                pred = _geometric_mean(df['price'])
-            elif self.mean_kind == 'arithmetic':
-                pred = df['price'].mean()
-            else:
-                raise Exception('Unknown mean_kind')
-            self.name_predictions[name] = pred
-
+        prices = pd.Series(np.asarray(y, dtype=float), index=x.index)
+        if self.mean_kind == 'geometric':
+            self.name_predictions = np.exp(np.log(prices).groupby(x['name']).mean())
+        elif self.mean_kind == 'arithmetic':
+            self.name_predictions = prices.groupby(x['name']).mean()
+        else:
+            raise Exception('Unknown mean_kind')
+
+    @profiled
     def predict(self, x):
-        y = []
-        for i, row in x.iterrows():
-            name = row['name']
-            y.append(self.name_predictions.get(name, None))
-
-        return np.array(y)
+        """
+        Прогноз цен, NaN для неизвестных наименований
+        """
+        codes = pd.Categorical(x['name'], categories=self.name_predictions.index).codes
+        return np.append(self.name_predictions.values, np.nan)[codes]
@@ -1,5 +1,7 @@
 from sklearn.base import BaseEstimator, RegressorMixin
 import numpy as np
+import pandas as pd
+from profiling import profiled
 
 
 class Model(BaseEstimator, RegressorMixin):
@@ -7,18 +9,20 @@ class Model(BaseEstimator, RegressorMixin):
     def __init__(self):
         self.name_predictions = None
 
+    @profiled
     def fit(self, x, y):
-        data = x.copy()
-        data['price'] = y
-        self.name_predictions = {}
-        for name, df in data.groupby('name'):
-            df = df.sort_values('order_date', ascending=False)
-            self.name_predictions[name] = df.iloc[0]['price']
+        data = pd.DataFrame({
+            'name': x['name'].values,
+            'order_date': pd.to_datetime(x['order_date']).values,
+            'price': np.asarray(y, dtype=float),
+        })
+        data = data.sort_values('order_date', kind='mergesort', na_position='first')
+        self.name_predictions = data.groupby('name')['price'].last()
 
+    @profiled
     def predict(self, x):
-        y = []
-        for i, row in x.iterrows():
-            name = row['name']
-            y.append(self.name_predictions.get(name, None))
-
-        return np.array(y)
+        """
+        Прогноз цен, NaN для неизвестных наименований
+        """
+        codes = pd.Categorical(x['name'], categories=self.name_predictions.index).codes
+        return np.append(self.name_predictions.values, np.nan)[codes]
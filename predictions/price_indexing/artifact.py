@@ -0,0 +1,175 @@
+"""
+Компактный формат сохранения модели индексации цен
+
+Версия 2. Файл Arrow IPC (Feather v2) без сжатия, читается через memory mapping.
+
+Одна строка с колонками-списками:
+    "name" (list<string>) - наименования
+    "base_price" (list<float64>) - средние геометрические цены наименований, нормированные на индекс
+    "day_coefs" (list<float64>) - подневные изменения цены подряд
+        с "day_coefs_start_date", NaN для дней без изменений
+
+Метаданные схемы:
+    "format" - всегда "price_indexing_model"
+    "format_version" - версия формата, сейчас "2"
+    "header" - JSON с полями
+        "day_coefs_start_date" - дата первого подневного коэффициента, ISO
+        "index_start_date", "index_end_date" - границы индекса, ISO
+        "use_cleaned_name" - параметр модели
+        "metadata" - произвольный JSON, переданный в save_model
+
+Индекс восстанавливается из подневных коэффициентов при загрузке.
+
+Файлы, сохраненные joblib до появления формата, при загрузке
+мигрируют автоматически, если в них осталась обучающая выборка.
+"""
+import datetime
+import json
+import os
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from .construction import aggregate_date_log_prices, convert_day_changes_to_index
+from .model import Model
+from profiling import profiled
+
+
+FORMAT = 'price_indexing_model'
+FORMAT_VERSION = 2
+ARROW_MAGIC = b'ARROW1'
+
+
+class ArtifactVersionError(Exception):
+    pass
+
+
+@profiled
+def save_model(model, path, metadata=None):
+    if model.index_keys:
+        raise ValueError(f'Models with index_keys are not supported by format version {FORMAT_VERSION}')
+    day_coefs = model.daily_price_changes
+    day_coefs_start_date = pd.Timestamp(day_coefs['date'].iloc[0])
+    day_offsets = (pd.to_datetime(day_coefs['date']) - day_coefs_start_date).dt.days.values
+    dense_day_coefs = np.full(day_offsets[-1] + 1, np.nan)
+    dense_day_coefs[day_offsets] = day_coefs['coef'].values
+
+    header = dict(
+        day_coefs_start_date=day_coefs_start_date.date().isoformat(),
+        index_start_date=model.price_index.index[0].date().isoformat(),
+        index_end_date=model.price_index.index[-1].date().isoformat(),
+        use_cleaned_name=model.use_cleaned_name,
+        metadata=metadata or {},
+    )
+    table = pa.table({
+        'name': _to_list_column(pa.array(model.name_base_prices.index.values, pa.string())),
+        'base_price': _to_list_column(pa.array(model.name_base_prices.values, pa.float64())),
+        'day_coefs': _to_list_column(pa.array(dense_day_coefs, pa.float64())),
+    }).replace_schema_metadata({
+        b'format': FORMAT.encode(),
+        b'format_version': str(FORMAT_VERSION).encode(),
+        b'header': json.dumps(header, ensure_ascii=False).encode(),
+    })
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+
+
+def _to_list_column(values):
+    return pa.ListArray.from_arrays(pa.array([0, len(values)], pa.int32()), values)
+
+
+def _read_list_column(table, name):
+    return table.column(name).chunk(0).values
+
+
+def _is_arrow_file(path):
+    with open(path, 'rb') as f:
+        return f.read(len(ARROW_MAGIC)) == ARROW_MAGIC
+
+
+def _check_version(path, schema_metadata):
+    if schema_metadata is None or schema_metadata.get(b'format') != FORMAT.encode():
+        raise ArtifactVersionError(f'{path} is not a price indexing model artifact')
+    version = int(schema_metadata[b'format_version'])
+    if version != FORMAT_VERSION:
+        raise ArtifactVersionError(
+            f'{path} has price indexing model format version {version},'
+            f' this code reads version {FORMAT_VERSION}. Refit the model.'
+        )
+
+
+def read_artifact_metadata(path):
+    """
+    Возвращает метаданные, переданные в save_model, не читая саму модель
+    """
+    if not _is_arrow_file(path):
+        return None
+    with pa.memory_map(path) as source:
+        schema_metadata = pa.ipc.open_file(source).schema.metadata
+    _check_version(path, schema_metadata)
+    return json.loads(schema_metadata[b'header'])['metadata']
+
+
+@profiled
+def load_model(path):
+    if not _is_arrow_file(path):
+        return _migrate_legacy_model(path)
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        _check_version(path, reader.schema.metadata)
+        table = reader.read_all()
+    header = json.loads(table.schema.metadata[b'header'])
+
+    dense_day_coefs = _read_list_column(table, 'day_coefs').to_numpy()
+    covered_days = np.flatnonzero(~np.isnan(dense_day_coefs))
+    day_coefs_start_date = np.datetime64(header['day_coefs_start_date'], 'D')
+    dates = day_coefs_start_date + covered_days.astype('timedelta64[D]')
+
+    model = Model(use_cleaned_name=header['use_cleaned_name'])
+    model.daily_price_changes = pd.DataFrame({
+        'date': dates.astype(object),
+        'coef': dense_day_coefs[covered_days],
+    })
+    model.price_index = convert_day_changes_to_index(
+        model.daily_price_changes,
+        datetime.date.fromisoformat(header['index_start_date']),
+        datetime.date.fromisoformat(header['index_end_date'])
+    )
+    model.name_base_prices = pd.Series(
+        _read_list_column(table, 'base_price').to_numpy(),
+        index=pd.Index(_read_list_column(table, 'name').to_pandas(), name='name')
+    )
+    return model
+
+
+def _migrate_legacy_model(path):
+    try:
+        legacy = joblib.load(path)
+    except Exception as exc:
+        raise ArtifactVersionError(
+            f'{path} is neither a price indexing model artifact of version {FORMAT_VERSION}'
+            ' nor a legacy joblib model'
+        ) from exc
+    if isinstance(legacy, dict):
+        legacy = legacy.get('model')
+    train_data = getattr(legacy, 'train_data', None)
+    if not isinstance(legacy, Model) or train_data is None:
+        raise ArtifactVersionError(f'{path} is a legacy joblib model that can not be migrated. Refit the model.')
+
+    model = Model(use_cleaned_name=legacy.use_cleaned_name)
+    model.daily_price_changes = legacy.daily_price_changes
+    model.price_index = legacy.price_index
+    if isinstance(model.price_index, pd.DataFrame):
+        model.price_index = pd.Series(
+            model.price_index['coef'].values,
+            index=pd.DatetimeIndex(pd.to_datetime(model.price_index['date']), name='date'),
+            name='coef'
+        )
+    model.date_log_prices = aggregate_date_log_prices(
+        train_data[['name', 'price', 'order_date']].rename({'order_date': 'date'}, axis=1)
+    )
+    model.set_name_base_prices()
+    return model
@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 import datetime
+import joblib
+from profiling import profiled
 
 
 def _geometric_mean(x):
@@ -11,10 +13,13 @@ MIN_DEFAULT_DATE = datetime.date(2015, 1, 1)
 MAX_DEFAULT_DATE = datetime.date.today() + datetime.timedelta(days=183) # a half of year
 
 
+@profiled
 def build_price_index(df,
                       min_date=MIN_DEFAULT_DATE,
                       max_date=MAX_DEFAULT_DATE,
-                      outliers_percentile=0):
+                      outliers_percentile=0,
+                      freq='D',
+                      n_jobs=1):
     """
     Строит индекс изменения цен
 
@@ -28,13 +33,16 @@ def build_price_index(df,
         Последняя дата результирующего индекса
     outliers_percentile: int
         Сколько процентов отрезков отбрасывать с каждой стороны по угловому коэффициенту
+    freq: str
+        Шаг результирующего индекса в формате pandas.date_range
+    n_jobs: int
+        Количество процессов для поиска изменений цен по наименованиям
 
     Returns
     -------
     dict
-        Два значения с датафреймами. Датафреймы имеют колонки "date", "coef"
-        "price_index" - Результирующий индекс
-        "daily_price_changes" - Подневные изменения цены
+        "price_index" - Результирующий индекс, pandas.Series "coef" с индексом "date" типа datetime64
+        "daily_price_changes" - Подневные изменения цены, датафрейм с колонками "date", "coef"
 
     Examples
     --------
@@ -44,72 +52,422 @@ def build_price_index(df,
     >>>    'price': [200, 300]
     >>> }))
     """
-    price_changes = get_normalized_price_changes(df)
+    price_changes = get_normalized_price_changes(df, n_jobs)
     price_changes_without_outliers = remove_outliers(price_changes, outliers_percentile)
     daily_price_changes = calculate_price_changes_by_dates(price_changes_without_outliers)
-    price_index = convert_day_changes_to_index(daily_price_changes, min_date, max_date)
+    price_index = convert_day_changes_to_index(daily_price_changes, min_date, max_date, freq)
     return dict(
         price_index=price_index,
         daily_price_changes=daily_price_changes
     )
 
 
-def get_normalized_price_changes(df):
-    price_changes = []
-    for name, name_df in df.groupby('name'):
-        aggregated_date_prices = []
-        for date, date_df in name_df.groupby('date'):
-            aggregated_date_prices.append((date, _geometric_mean(date_df['price'])))
-        name_price_df = pd.DataFrame(aggregated_date_prices, columns=['date', 'price'])
-        name_price_df = name_price_df.sort_values('date')
-        shift = (len(name_price_df) + 3) // 4
-        for (date_1, price_1), (date_2, price_2) in zip(name_price_df.values, name_price_df.values[shift:]):
-            min_interval = 15
-            if (date_2 - date_1).days < min_interval:
-                date_1 = date_2 - datetime.timedelta(days=min_interval)
-            price_changes.append((date_1, date_2, price_2 / price_1))
+PRICE_CHANGE_DTYPE = np.dtype([
+    ('date_1', 'datetime64[D]'),
+    ('date_2', 'datetime64[D]'),
+    ('coef', 'float64'),
+])
+MIN_INTERVAL = 15
+
+
+def aggregate_date_log_prices(df):
+    """
+    Суммы логарифмов цен и количества записей по наименованиям и датам
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Датафрейм с колонками "name", "date", "price"
+
+    Returns
+    -------
+    pandas.DataFrame
+        Колонки "log_price_sum", "count" с индексом ("name", "date"), отсортированным по возрастанию
+    """
+    return np.log(df['price']) \
+        .groupby([df['name'].rename('name'), pd.to_datetime(df['date']).rename('date')]) \
+        .agg(['sum', 'count']) \
+        .rename({'sum': 'log_price_sum'}, axis=1)
+
+
+@profiled
+def get_normalized_price_changes(df, n_jobs=1):
+    """
+    Находит изменения цен каждого наименования
+
+    Цены за один день усредняются геометрически, затем каждая цена
+    сравнивается с ценой через четверть записей наименования.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Датафрейм с колонками "name", "date", "price"
+    n_jobs : int
+        Количество процессов, см. aggregate_and_get_price_changes
+
+    Returns
+    -------
+    numpy.ndarray
+        Структурированный массив PRICE_CHANGE_DTYPE с полями "date_1", "date_2", "coef"
+    """
+    _, price_changes, _ = aggregate_and_get_price_changes(df, n_jobs)
     return price_changes
 
 
-def remove_outliers(price_changes, outliers_percentile):
-    day_slopes = [coef ** (1.0 / (date_2 - date_1).days) for date_1, date_2, coef in price_changes]
+@profiled
+def aggregate_and_get_price_changes(df, n_jobs=1):
+    """
+    Агрегирует цены по дням и находит изменения цен наименований
+
+    Наименования независимы, поэтому при n_jobs > 1 они делятся на
+    непрерывные диапазоны с примерно равным количеством записей и
+    обрабатываются в отдельных процессах. Колонки передаются процессам
+    через memory mapping (joblib), результаты склеиваются в порядке
+    наименований и совпадают с последовательным расчетом с точностью
+    до округления.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Датафрейм с колонками "name", "date", "price"
+    n_jobs : int
+        Количество процессов
+
+    Returns
+    -------
+    tuple
+        Результат aggregate_date_log_prices, структурированный массив
+        PRICE_CHANGE_DTYPE и массив наименований его отрезков
+    """
+    if n_jobs == 1:
+        date_log_prices = aggregate_date_log_prices(df)
+        price_changes, price_change_names = get_price_changes(
+            date_log_prices['log_price_sum'] / date_log_prices['count']
+        )
+        return date_log_prices, price_changes, price_change_names
+
+    name_codes, names = pd.factorize(df['name'], sort=True)
+    dates = pd.to_datetime(df['date']).values
+    order = np.flatnonzero((name_codes >= 0) & ~np.isnat(dates))
+    if len(order) == 0:
+        return aggregate_and_get_price_changes(df.iloc[:0], n_jobs=1)
+    order = order[np.argsort(name_codes[order], kind='stable')]
+    name_codes = name_codes[order]
+    days = dates[order].astype('datetime64[D]').astype(np.int64)
+    prices = df['price'].values[order].astype(np.float64)
+
+    n_jobs = joblib.effective_n_jobs(n_jobs)
+    row_bounds = np.linspace(0, len(name_codes), n_jobs + 1).astype(int)[1:-1]
+    shard_bounds = np.unique(np.r_[0, np.searchsorted(name_codes, name_codes[row_bounds]), len(name_codes)])
+    shards = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(_aggregate_and_get_shard_price_changes)(name_codes, days, prices, start, end)
+        for start, end in zip(shard_bounds[:-1], shard_bounds[1:])
+    )
+
+    date_log_prices = pd.concat([shard[0] for shard in shards])
+    date_log_prices.index = date_log_prices.index.set_levels(names[date_log_prices.index.levels[0]], level='name')
+    price_changes = np.concatenate([shard[1] for shard in shards])
+    price_change_names = names[np.concatenate([shard[2] for shard in shards])]
+    return date_log_prices, price_changes, np.asarray(price_change_names, dtype=object)
+
+
+def _aggregate_and_get_shard_price_changes(name_codes, days, prices, start, end):
+    shard = pd.DataFrame({
+        'name': name_codes[start:end],
+        'date': days[start:end].astype('datetime64[D]'),
+        'price': prices[start:end],
+    })
+    date_log_prices = aggregate_date_log_prices(shard)
+    price_changes, price_change_names = get_price_changes(
+        date_log_prices['log_price_sum'] / date_log_prices['count']
+    )
+    return date_log_prices, price_changes, price_change_names
+
+
+def get_price_changes(date_log_prices):
+    """
+    Находит изменения цен по средним логарифмам цен наименований за дни
+
+    Parameters
+    ----------
+    date_log_prices : pandas.Series
+        Средний логарифм цены с индексом ("name", "date"), отсортированным по возрастанию
+
+    Returns
+    -------
+    tuple
+        Структурированный массив PRICE_CHANGE_DTYPE и массив наименований его отрезков
+    """
+    name_codes = date_log_prices.index.codes[0]
+    dates = pd.to_datetime(date_log_prices.index.get_level_values(1)).values.astype('datetime64[D]')
+    prices = np.exp(date_log_prices.values)
+
+    name_starts = np.flatnonzero(np.r_[True, name_codes[1:] != name_codes[:-1]])
+    name_sizes = np.diff(np.r_[name_starts, len(name_codes)])
+    positions = np.arange(len(name_codes)) - np.repeat(name_starts, name_sizes)
+    shifts = np.repeat((name_sizes + 3) // 4, name_sizes)
+    first = np.flatnonzero(positions + shifts < np.repeat(name_sizes, name_sizes))
+    second = first + shifts[first]
+
+    price_changes = np.empty(len(first), dtype=PRICE_CHANGE_DTYPE)
+    price_changes['date_2'] = dates[second]
+    price_changes['date_1'] = np.minimum(dates[first], dates[second] - np.timedelta64(MIN_INTERVAL, 'D'))
+    price_changes['coef'] = prices[second] / prices[first]
+    return price_changes, date_log_prices.index.get_level_values(0).values[first]
+
+
+def get_inliers_mask(price_changes, outliers_percentile):
+    days = (price_changes['date_2'] - price_changes['date_1']).astype(int)
+    day_slopes = price_changes['coef'] ** (1.0 / days)
     left_percentile = np.percentile(day_slopes, outliers_percentile)
     right_percentile = np.percentile(day_slopes, 100 - outliers_percentile)
 
-    return [
-        item
-        for item, day_slope
-        in zip(price_changes, day_slopes)
-        if day_slope > left_percentile and day_slope < right_percentile
-    ]
+    return (day_slopes > left_percentile) & (day_slopes < right_percentile)
+
+
+@profiled
+def remove_outliers(price_changes, outliers_percentile):
+    return price_changes[get_inliers_mask(price_changes, outliers_percentile)]
+
+
+class DailyLogSlopes:
+    """
+    Суммы логарифмов подневных угловых коэффициентов и количества отрезков по дням
+
+    Геометрическое среднее по дню - это среднее логарифмов угловых
+    коэффициентов покрывающих его отрезков. Суммы и количества хранятся
+    разностными массивами по оси дней, поэтому отрезки добавляются
+    и удаляются за O(отрезков) без разворачивания в отдельные дни.
+
+    Накопителей может быть несколько (строки массивов), например общий
+    индекс и индексы по группам. Один отрезок может попадать в несколько
+    строк сразу, все строки обновляются одним проходом.
+    """
+
+    def __init__(self):
+        self.first_date = None
+        self.log_slope_diffs = np.zeros((1, 0))
+        self.count_diffs = np.zeros((1, 0), dtype=np.int64)
+
+    def add(self, price_changes, rows=None, sign=1):
+        """
+        Parameters
+        ----------
+        price_changes : numpy.ndarray
+            Структурированный массив PRICE_CHANGE_DTYPE
+        rows : numpy.ndarray
+            Номера строк накопителей для каждого отрезка, по умолчанию 0.
+            Двумерный массив задает несколько строк на отрезок, -1 - пропуск
+        sign : int
+            1 - добавить отрезки, -1 - удалить
+        """
+        if len(price_changes) == 0:
+            return
+        if rows is None:
+            rows = np.zeros(len(price_changes), dtype=np.int64)
+        rows = np.asarray(rows).reshape(len(price_changes), -1)
+        self._extend(price_changes['date_1'].min(), price_changes['date_2'].max(), rows.max() + 1)
+        starts = (price_changes['date_1'] - self.first_date).astype(int)
+        ends = (price_changes['date_2'] - self.first_date).astype(int)
+        log_slopes = sign * np.log(price_changes['coef']) / (ends - starts)
+
+        n_columns = rows.shape[1]
+        selected = rows.ravel() >= 0
+        rows = rows.ravel()[selected]
+        starts = np.repeat(starts, n_columns)[selected]
+        ends = np.repeat(ends, n_columns)[selected]
+        log_slopes = np.repeat(log_slopes, n_columns)[selected]
+
+        n_rows, n_days = self.count_diffs.shape
+        starts = rows * n_days + starts
+        ends = rows * n_days + ends
+        size = n_rows * n_days
+        self.log_slope_diffs += (
+                np.bincount(starts, weights=log_slopes, minlength=size) -
+                np.bincount(ends, weights=log_slopes, minlength=size)
+        ).reshape(n_rows, n_days)
+        self.count_diffs += sign * (
+                np.bincount(starts, minlength=size) -
+                np.bincount(ends, minlength=size)
+        ).reshape(n_rows, n_days)
+
+    def remove(self, price_changes, rows=None):
+        self.add(price_changes, rows, sign=-1)
 
+    def _extend(self, first_date, last_date, n_rows):
+        if self.first_date is None:
+            self.first_date = first_date
+        head = max(int((self.first_date - first_date).astype(int)), 0)
+        self.first_date = min(self.first_date, first_date)
+        tail = max(int((last_date - self.first_date).astype(int)) + 1 - head - self.count_diffs.shape[1], 0)
+        extra_rows = max(n_rows - self.count_diffs.shape[0], 0)
+        if head or tail or extra_rows:
+            self.log_slope_diffs = np.pad(self.log_slope_diffs, ((0, extra_rows), (head, tail)))
+            self.count_diffs = np.pad(self.count_diffs, ((0, extra_rows), (head, tail)))
 
+    def to_frame(self, row=0):
+        """
+        Returns
+        -------
+        pandas.DataFrame
+            Колонки "date", "coef" для дней, покрытых хотя бы одним отрезком строки row
+        """
+        if self.first_date is None or row >= self.count_diffs.shape[0]:
+            return pd.DataFrame({'date': [], 'coef': []})
+        counts = np.cumsum(self.count_diffs[row])
+        covered_days = np.flatnonzero(counts > 0)
+        log_slope_sums = np.cumsum(self.log_slope_diffs[row])[covered_days]
+        dates = self.first_date + covered_days.astype('timedelta64[D]')
+        return pd.DataFrame({
+            'date': dates.astype(object),
+            'coef': np.exp(log_slope_sums / counts[covered_days]),
+        })
+
+
+@profiled
 def calculate_price_changes_by_dates(price_changes):
-    day_coefs = []
-    for date_1, date_2, coef in price_changes:
-        days = (date_2 - date_1).days
-        day_coef = coef ** (1.0 / days)
-        for i in range(days):
-            cur_date = date_1 + datetime.timedelta(days=i)
-            day_coefs.append((cur_date, day_coef))
-    df = pd.DataFrame(day_coefs, columns=['date', 'coef'])
-    aggregated_coefs = []
-    for date, date_df in df.groupby('date'):
-        aggregated_coefs.append((date, _geometric_mean(date_df['coef'])))
-    df = pd.DataFrame(aggregated_coefs, columns=['date', 'coef'])
-    df = df.sort_values('date')
-
-    return df
-
-
-def convert_day_changes_to_index(day_coefs, min_date, max_date):
-    average_day_coef = _geometric_mean(day_coefs['coef'])
-    day_coef_dict = {row['date']: row['coef'] for _, row in day_coefs.iterrows()}
-    cur_date = min_date
-    cur_coef = 1.0
-    result = []
-    while cur_date <= max_date:
-        result.append((cur_date, cur_coef))
-        cur_coef *= day_coef_dict.get(cur_date, average_day_coef)
-        cur_date = cur_date + datetime.timedelta(days=1)
-    return pd.DataFrame(result, columns=['date', 'coef'])
+    """
+    Усредняет подневные изменения цен по всем отрезкам
+
+    Parameters
+    ----------
+    price_changes : numpy.ndarray
+        Структурированный массив PRICE_CHANGE_DTYPE
+
+    Returns
+    -------
+    pandas.DataFrame
+        Колонки "date", "coef" для дней, покрытых хотя бы одним отрезком
+    """
+    daily_log_slopes = DailyLogSlopes()
+    daily_log_slopes.add(price_changes)
+    return daily_log_slopes.to_frame()
+
+
+GLOBAL_INDEX = (None, None)
+
+
+def get_name_key_counts(df, key):
+    """
+    Количество записей наименований по значениям ключа, например "group" или "region"
+
+    Returns
+    -------
+    pandas.Series
+        Количества с индексом ("name", "value")
+    """
+    return df.groupby([df['name'].rename('name'), df[key].rename('value')]).size()
+
+
+def get_name_keys(name_key_counts):
+    """
+    Самое частое значение ключа для каждого наименования
+
+    Returns
+    -------
+    pandas.Series
+        Значения ключа с индексом "name"
+    """
+    counts = name_key_counts.rename('count').reset_index()
+    counts = counts.sort_values(['name', 'count', 'value'], ascending=[True, False, True])
+    return counts.drop_duplicates('name').set_index('name')['value']
+
+
+@profiled
+def build_price_indices(df,
+                        keys,
+                        min_date=MIN_DEFAULT_DATE,
+                        max_date=MAX_DEFAULT_DATE,
+                        outliers_percentile=0,
+                        freq='D',
+                        n_jobs=1):
+    """
+    Строит общий индекс и индексы по значениям ключей за один проход
+
+    Отрезки изменения цен ищутся один раз. Каждый отрезок попадает
+    в общий индекс и в индекс самого частого значения каждого ключа
+    своего наименования, все накопители обновляются одним проходом.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Датафрейм с колонками "name", "date", "price" и колонками ключей
+    keys : list
+        Колонки ключей, например ["group", "region"]
+    min_date, max_date, outliers_percentile, freq, n_jobs
+        См. build_price_index
+
+    Returns
+    -------
+    dict
+        "price_indices" - индексы pandas.Series по меткам (ключ, значение), общий под меткой GLOBAL_INDEX;
+            значения без единого отрезка пропускаются
+        "daily_price_changes" - подневные изменения цены по тем же меткам
+        "segment_counts" - количество отрезков в каждом индексе по тем же меткам
+    """
+    _, price_changes, price_change_names = aggregate_and_get_price_changes(df[['name', 'date', 'price']], n_jobs)
+    inliers = get_inliers_mask(price_changes, outliers_percentile)
+    price_changes, price_change_names = price_changes[inliers], price_change_names[inliers]
+
+    labels = [GLOBAL_INDEX]
+    price_change_rows = [np.zeros(len(price_changes), dtype=np.int64)]
+    for key in keys:
+        name_keys = get_name_keys(get_name_key_counts(df, key))
+        values = np.sort(name_keys.unique())
+        value_rows = pd.Series(np.arange(len(values)) + len(labels), index=values)
+        labels += [(key, value) for value in values]
+        segment_values = name_keys.reindex(price_change_names).values
+        price_change_rows.append(value_rows.reindex(segment_values).fillna(-1).astype(np.int64).values)
+    price_change_rows = np.column_stack(price_change_rows)
+
+    daily_log_slopes = DailyLogSlopes()
+    daily_log_slopes.add(price_changes, price_change_rows)
+    segment_counts = np.bincount(price_change_rows[price_change_rows >= 0], minlength=len(labels))
+    daily_price_changes = {
+        label: daily_log_slopes.to_frame(row)
+        for row, label in enumerate(labels)
+        if segment_counts[row] > 0
+    }
+    return dict(
+        price_indices={
+            label: convert_day_changes_to_index(day_coefs, min_date, max_date, freq)
+            for label, day_coefs in daily_price_changes.items()
+        },
+        daily_price_changes=daily_price_changes,
+        segment_counts={label: segment_counts[row] for row, label in enumerate(labels) if segment_counts[row] > 0},
+    )
+
+
+@profiled
+def convert_day_changes_to_index(day_coefs, min_date=MIN_DEFAULT_DATE, max_date=MAX_DEFAULT_DATE, freq='D'):
+    """
+    Накапливает подневные изменения цен в индекс
+
+    Дни без изменений заполняются средним геометрическим изменением.
+    Внутри дня индекс меняется равномерно в логарифмическом масштабе.
+
+    Parameters
+    ----------
+    day_coefs : pandas.DataFrame
+        Колонки "date", "coef"
+    min_date : datetime.date
+        Первая дата индекса, на ее начало индекс равен 1
+    max_date : datetime.date
+        Последняя дата индекса
+    freq : str
+        Шаг индекса в формате pandas.date_range, например "D", "W" или "H"
+
+    Returns
+    -------
+    pandas.Series
+        Значения индекса "coef" с индексом "date" типа datetime64
+    """
+    log_day_coefs = np.log(day_coefs['coef'].values)
+    days = pd.date_range(pd.Timestamp(min_date).floor('D'), pd.Timestamp(max_date).ceil('D'), freq='D')
+    log_day_coefs = pd.Series(log_day_coefs, index=pd.to_datetime(day_coefs['date'])) \
+        .reindex(days) \
+        .fillna(log_day_coefs.mean())
+    log_index = np.r_[0.0, np.cumsum(log_day_coefs.values[:-1])]
+
+    dates = pd.date_range(min_date, max_date, freq=freq, name='date')
+    return pd.Series(np.exp(np.interp(dates.asi8, days.asi8, log_index)), index=dates, name='coef')
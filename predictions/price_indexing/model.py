@@ -1,62 +1,242 @@
 from sklearn.base import BaseEstimator, RegressorMixin
-from .construction import build_price_index
+from .construction import (
+    GLOBAL_INDEX,
+    DailyLogSlopes,
+    aggregate_and_get_price_changes,
+    aggregate_date_log_prices,
+    convert_day_changes_to_index,
+    get_inliers_mask,
+    get_name_key_counts,
+    get_name_keys,
+    get_price_changes,
+)
 import numpy as np
+import pandas as pd
 import warnings
+from profiling import profiled
 
 
 warnings.filterwarnings('ignore')
 
 
-def _geometric_mean(x):
-    return np.exp(np.log(x).mean())
+OUTLIERS_PERCENTILE = 8
+MIN_INDEX_SEGMENTS = 100
 
 
 class Model(BaseEstimator, RegressorMixin):
+    """
+    Модель индексации цен
 
-    def __init__(self, use_cleaned_name=False):
-        self.train_data = None
+    Parameters
+    ----------
+    use_cleaned_name : bool
+        Строить индекс по очищенным наименованиям
+    n_jobs : int
+        Количество процессов для поиска изменений цен
+    index_keys : tuple
+        Колонки, по значениям которых строятся отдельные индексы, от самой специфичной
+        к самой общей, например ("group", "region"). Каждое наименование относится
+        к самому частому своему значению ключа и оценивается по первому индексу,
+        в котором не меньше min_index_segments отрезков, иначе по общему индексу
+    min_index_segments : int
+        Минимальное количество отрезков изменения цены в индексе по значению ключа
+    """
+
+    def __init__(self, use_cleaned_name=False, n_jobs=1, index_keys=(), min_index_segments=MIN_INDEX_SEGMENTS):
         self.daily_price_changes = None
         self.price_index = None
-        self.price_index_dict = None
+        self.name_base_prices = None
+        self.date_log_prices = None
+        self.price_changes = None
+        self.price_change_names = None
+        self.inliers = None
+        self.daily_log_slopes = None
+        self.price_change_rows = None
+        self.index_labels = None
+        self.name_key_counts = None
+        self.name_keys = None
+        self.price_indices = None
+        self.price_index_matrix = None
+        self.name_index_rows = None
         self.use_cleaned_name = use_cleaned_name
+        self.n_jobs = n_jobs
+        self.index_keys = index_keys
+        self.min_index_segments = min_index_segments
 
-    def fit(self, x, y):
+    def _get_index_data(self, x, y):
         data = x.copy()
         if self.use_cleaned_name:
             data['name'] = data['cleaned_name']
         data['price'] = y
-        data = data.copy()[~data['order_date'].isna()]
-        self.train_data = data
-        data_for_index = \
-            data[['name', 'price', 'order_date']] \
-                .rename({'order_date': 'date'}, axis=1)
-        result = build_price_index(data_for_index, outliers_percentile=8)
-        self.daily_price_changes = result['daily_price_changes']
-        self.price_index = result['price_index']
-        self.price_index_dict = {
-            date: price
-            for date, price
-            in zip(self.price_index['date'], self.price_index['coef'])
-        }
+        data = data[~data['order_date'].isna()]
+        return data[['name', 'price', 'order_date', *self.index_keys]].rename({'order_date': 'date'}, axis=1)
+
+    @profiled
+    def fit(self, x, y):
+        data = self._get_index_data(x, y)
+        self.date_log_prices, self.price_changes, self.price_change_names = \
+            aggregate_and_get_price_changes(data[['name', 'date', 'price']], self.n_jobs)
+        self.name_key_counts = {key: get_name_key_counts(data, key) for key in self.index_keys}
+        self.name_keys = {key: get_name_keys(counts) for key, counts in self.name_key_counts.items()}
+        self.index_labels = {GLOBAL_INDEX: 0}
+        self.price_change_rows = self._get_price_change_rows(self.price_change_names)
+        self.inliers = np.zeros(len(self.price_changes), dtype=bool)
+        self.daily_log_slopes = DailyLogSlopes()
+        self._update_index()
+
+    def _get_index_rows(self, key, values):
+        """
+        Строки накопителей индексов по значениям ключа, -1 для пропусков
+
+        Новые значения получают новые строки.
+        """
+        codes, uniques = pd.factorize(values)
+        unique_rows = [self.index_labels.setdefault((key, value), len(self.index_labels)) for value in uniques]
+        return np.array(unique_rows + [-1], dtype=np.int64)[codes]
+
+    def _get_price_change_rows(self, price_change_names):
+        """
+        Строки накопителей индексов для отрезков: общий индекс и индексы по значениям ключей наименований
+        """
+        rows = [np.zeros(len(price_change_names), dtype=np.int64)]
+        for key in self.index_keys:
+            rows.append(self._get_index_rows(key, self.name_keys[key].reindex(price_change_names).values))
+        return np.column_stack(rows)
+
+    @profiled
+    def partial_fit(self, x, y):
+        """
+        Дообучает модель на новых записях
+
+        Отрезки изменения цен пересчитываются только для наименований
+        из новых записей, подневные суммы обновляются на разницу.
+        Результат совпадает с fit на объединенных данных с точностью
+        до ошибок округления.
+        """
+        if self.price_index is None:
+            return self.fit(x, y)
+        if self.price_changes is None:
+            raise ValueError('The model has no training aggregates, it was loaded from an artifact. Refit it.')
+
+        data = self._get_index_data(x, y)
+        new_date_log_prices = aggregate_date_log_prices(data)
+        affected_names = new_date_log_prices.index.unique(level='name')
+        affected_rows = self.date_log_prices.index.get_level_values('name').isin(affected_names)
+        affected_date_log_prices = pd.concat([self.date_log_prices[affected_rows], new_date_log_prices]) \
+            .groupby(level=['name', 'date']) \
+            .sum()
+        self.date_log_prices = pd.concat([self.date_log_prices[~affected_rows], affected_date_log_prices])
+
+        for key in self.index_keys:
+            counts = self.name_key_counts[key]
+            affected_count_rows = counts.index.get_level_values('name').isin(affected_names)
+            affected_counts = pd.concat([counts[affected_count_rows], get_name_key_counts(data, key)]) \
+                .groupby(level=['name', 'value']) \
+                .sum()
+            self.name_key_counts[key] = pd.concat([counts[~affected_count_rows], affected_counts])
+            name_keys = self.name_keys[key]
+            self.name_keys[key] = pd.concat([name_keys[~name_keys.index.isin(affected_names)], get_name_keys(affected_counts)])
+
+        affected = pd.Index(self.price_change_names).isin(affected_names)
+        removed = affected & self.inliers
+        self.daily_log_slopes.remove(self.price_changes[removed], self.price_change_rows[removed])
+        price_changes, price_change_names = get_price_changes(
+            affected_date_log_prices['log_price_sum'] / affected_date_log_prices['count']
+        )
+        self.price_changes = np.concatenate([self.price_changes[~affected], price_changes])
+        self.price_change_names = np.concatenate([self.price_change_names[~affected], price_change_names])
+        self.price_change_rows = np.concatenate([
+            self.price_change_rows[~affected],
+            self._get_price_change_rows(price_change_names),
+        ])
+        self.inliers = np.concatenate([self.inliers[~affected], np.zeros(len(price_changes), dtype=bool)])
+        self._update_index()
+
+    def _update_index(self):
+        inliers = get_inliers_mask(self.price_changes, OUTLIERS_PERCENTILE)
+        removed, added = self.inliers & ~inliers, inliers & ~self.inliers
+        self.daily_log_slopes.remove(self.price_changes[removed], self.price_change_rows[removed])
+        self.daily_log_slopes.add(self.price_changes[added], self.price_change_rows[added])
+        self.inliers = inliers
+        self.daily_price_changes = self.daily_log_slopes.to_frame()
+        self.price_index = convert_day_changes_to_index(self.daily_price_changes)
+        if self.index_keys:
+            self._update_key_indices()
+        self.set_name_base_prices()
+
+    def _update_key_indices(self):
+        """
+        Строит индексы по значениям ключей с достаточным количеством отрезков
+        и выбирает индекс для каждого наименования
+        """
+        name_rows = {key: self._get_index_rows(key, self.name_keys[key].values) for key in self.index_keys}
+        rows = self.price_change_rows[self.inliers]
+        segment_counts = np.bincount(rows[rows >= 0], minlength=len(self.index_labels))
+        usable = segment_counts >= self.min_index_segments
+        usable[0] = True
+
+        self.price_indices = {GLOBAL_INDEX: self.price_index}
+        self.price_index_matrix = np.full((len(self.index_labels), len(self.price_index)), np.nan)
+        self.price_index_matrix[0] = self.price_index.values
+        for label, row in self.index_labels.items():
+            if row and usable[row]:
+                self.price_indices[label] = convert_day_changes_to_index(self.daily_log_slopes.to_frame(row))
+                self.price_index_matrix[row] = self.price_indices[label].values
+
+        name_index_rows = pd.Series(0, index=self.date_log_prices.index.unique(level='name'), dtype=np.int64)
+        for key in reversed(self.index_keys):
+            rows = name_rows[key]
+            selected = rows >= 0
+            selected[selected] = usable[rows[selected]]
+            name_index_rows[self.name_keys[key].index[selected]] = rows[selected]
+        self.name_index_rows = name_index_rows
+
+    def set_name_base_prices(self):
+        dates = self.date_log_prices.index.get_level_values('date')
+        counts = self.date_log_prices['count']
+        rows = self._get_name_index_rows(self.date_log_prices.index.get_level_values('name'))
+        log_base_price_sums = self.date_log_prices['log_price_sum'] - \
+            counts * np.log(self.get_date_price_coefs(dates, rows))
+        counts = counts.where(log_base_price_sums.notnull())
+        self.name_base_prices = np.exp(
+            log_base_price_sums.groupby(level='name').sum() / counts.groupby(level='name').sum()
+        )
 
     def get_date_price_coef(self, date):
-        return self.price_index_dict[date]
+        return self.price_index.at[pd.Timestamp(date)]
+
+    def get_date_price_coefs(self, dates, rows=None):
+        """
+        Значения индекса для массива дат, NaN для дат вне индекса
 
+        Parameters
+        ----------
+        dates : array-like
+            Даты
+        rows : numpy.array, optional
+            Строки price_index_matrix для каждой даты, по умолчанию общий индекс
+        """
+        if rows is None:
+            return self.price_index.reindex(pd.to_datetime(dates)).values
+
+        dates = pd.DatetimeIndex(pd.to_datetime(dates)).values
+        positions = (dates - self.price_index.index.values[0]).astype('timedelta64[D]').astype(np.int64)
+        valid = ~np.isnat(dates) & (positions >= 0) & (positions < self.price_index_matrix.shape[1])
+        coefs = np.full(len(dates), np.nan)
+        coefs[valid] = self.price_index_matrix[rows[valid], positions[valid]]
+        return coefs
+
+    def _get_name_index_rows(self, names):
+        """
+        Строки price_index_matrix для наименований, None без ключей индексов
+        """
+        if not self.index_keys:
+            return None
+        return pd.Index(names).map(self.name_index_rows).fillna(0).values.astype(np.int64)
+
+    @profiled
     def predict(self, x):
-        x = x.copy()
-        if self.use_cleaned_name:
-            x['name'] = x['cleaned_name']
-        y = []
-        for i, row in x.iterrows():
-            price_coefs = []
-            name_df = self.train_data[self.train_data['name'] == row['name']]
-            if len(name_df) == 0:
-                y.append(None)
-                continue
-            for date, price in zip(name_df['order_date'], name_df['price']):
-                price_coef = self.get_date_price_coef(date)
-                price_coefs.append(price / price_coef)
-            price_coef = _geometric_mean(price_coefs)
-            y.append(self.get_date_price_coef(row['order_date']) * price_coef)
-
-        return np.array(y)
+        names = x['cleaned_name'] if self.use_cleaned_name else x['name']
+        base_prices = names.map(self.name_base_prices).values
+
+        return base_prices * self.get_date_price_coefs(x['order_date'], self._get_name_index_rows(names))
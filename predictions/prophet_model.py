@@ -1,24 +1,117 @@
 from sklearn.base import BaseEstimator, RegressorMixin
+import hashlib
+import os
+import joblib
+import numpy as np
 import pandas as pd
+import prophet
 from prophet import Prophet
+from prophet.serialize import model_from_json, model_to_json
+from profiling import profiled
+
+
+MIN_POINTS = 10
+DEFAULT_CACHE_DIR = 'cache/prophet_models'
+PROPHET_PARAMS = dict(daily_seasonality=False)
+
+
+def _get_series_hash(df):
+    """
+    Хэш ряда, версии prophet и параметров модели - ключ кэша обученной модели
+    """
+    digest = hashlib.sha256()
+    digest.update(f'{prophet.__version__} {sorted(PROPHET_PARAMS.items())}'.encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def _fit_prophet(df):
+    model = Prophet(**PROPHET_PARAMS)
+    with suppress_stdout_stderr():
+        model.fit(df)
+    return model_to_json(model)
 
 
 class Model(BaseEstimator, RegressorMixin):
+    """
+    Отдельная модель Prophet на логарифмах цен для каждого наименования или группы
 
-    def __init__(self):
-        self.model = Prophet(daily_seasonality=False)
+    Parameters
+    ----------
+    key : str
+        Колонка, по значениям которой обучаются модели: "name", "cleaned_name" или "group"
+    min_points : int
+        Минимальное количество дат заказа, для значений с меньшим количеством прогноз NaN
+    n_jobs : int
+        Количество процессов для обучения
+    cache_dir : str
+        Каталог кэша обученных моделей, None - без кэша
+    """
 
+    def __init__(self, key='name', min_points=MIN_POINTS, n_jobs=1, cache_dir=DEFAULT_CACHE_DIR):
+        self.models = None
+        self.key = key
+        self.min_points = min_points
+        self.n_jobs = n_jobs
+        self.cache_dir = cache_dir
+
+    def _get_cache_path(self, series_hash):
+        return os.path.join(self.cache_dir, f'{series_hash}.json')
+
+    def _load_cached(self, series_hash):
+        if self.cache_dir is None or not os.path.exists(self._get_cache_path(series_hash)):
+            return None
+        with open(self._get_cache_path(series_hash), encoding='utf-8') as f:
+            return f.read()
+
+    def _save_cached(self, series_hash, model_json):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._get_cache_path(series_hash)
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            f.write(model_json)
+        os.replace(f'{path}.tmp', path)
+
+    @profiled
     def fit(self, x, y):
-        df = pd.DataFrame({'ds': x, 'y': y})
-        model = Prophet(daily_seasonality=False)
-        with suppress_stdout_stderr():
-            model.fit(df)
+        data = pd.DataFrame({
+            'key': x[self.key].values,
+            'ds': pd.to_datetime(x['order_date']).values,
+            'y': np.log(np.asarray(y, dtype=float)),
+        }).dropna()
+        series = {
+            key: df[['ds', 'y']].sort_values('ds', kind='mergesort')
+            for key, df in data.groupby('key')
+            if df['ds'].nunique() >= self.min_points
+        }
+        series_hashes = {key: _get_series_hash(df) for key, df in series.items()}
+        model_jsons = {key: self._load_cached(series_hash) for key, series_hash in series_hashes.items()}
 
-    def predict(self, x):
-        df = pd.DataFrame({'ds': x})
-        pred_df = self.model.predict(df)
+        missing = [key for key, model_json in model_jsons.items() if model_json is None]
+        fitted = joblib.Parallel(n_jobs=self.n_jobs)(joblib.delayed(_fit_prophet)(series[key]) for key in missing)
+        for key, model_json in zip(missing, fitted):
+            self._save_cached(series_hashes[key], model_json)
+            model_jsons[key] = model_json
+
+        self.models = {key: model_from_json(model_json) for key, model_json in model_jsons.items()}
 
-        return pred_df['yhat']
+    @profiled
+    def predict(self, x):
+        """
+        Прогноз цен, NaN для значений без модели
+        """
+        keys = pd.Series(x[self.key].values)
+        dates = pd.Series(pd.to_datetime(x['order_date']).values)
+        y = np.full(len(x), np.nan)
+        known = keys.isin(list(self.models)).values & dates.notnull().values
+        for key, positions in keys[known].groupby(keys[known]).indices.items():
+            positions = np.flatnonzero(known)[positions]
+            unique_dates = dates[positions].drop_duplicates()
+            forecast = self.models[key].predict(pd.DataFrame({'ds': unique_dates.values}))
+            log_prices = pd.Series(forecast['yhat'].values, index=unique_dates.values)
+            y[positions] = np.exp(log_prices.reindex(dates[positions].values).values)
+        return y
 
 
 # https://github.com/facebook/prophet/issues/223#issuecomment-310497971
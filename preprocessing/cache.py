@@ -0,0 +1,121 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+from . import group_matching, ingestion, name_normalization, secondary_preprocess
+from . import preprocess as primary_preprocess
+from .ingestion import get_file_stat, get_files_hash, read_columnar, read_columnar_metadata, write_columnar
+from .secondary_preprocess import preprocess
+from profiling import profiled
+
+
+DEFAULT_CACHE_PATH = 'cache/preprocessed_data.feather'
+
+# Changes in any of these files make the cached data stale
+DEPENDENCIES = [
+    ingestion.__file__,
+    primary_preprocess.__file__,
+    secondary_preprocess.__file__,
+    name_normalization.__file__,
+    name_normalization.SUBSTITUTIONS_PATH,
+    group_matching.__file__,
+    group_matching.GROUP_RULES_PATH,
+]
+
+
+def get_code_version():
+    return get_files_hash(DEPENDENCIES)
+
+
+def get_data_version(cache_path=DEFAULT_CACHE_PATH):
+    metadata = read_columnar_metadata(cache_path)
+    return metadata[b'source_hash'].decode() + metadata[b'code_version'].decode()
+
+
+def get_row_hashes(raw_data):
+    return pd.util.hash_pandas_object(raw_data, index=False).values
+
+
+def get_row_hashes_path(cache_path):
+    # хэши строк выгрузки, их больше, чем строк результата
+    return f'{os.path.splitext(cache_path)[0]}.row_hashes.feather'
+
+
+def _load_cache_metadata(cache_path):
+    metadata = read_columnar_metadata(cache_path)
+    if metadata is None or metadata.get(b'code_version') != get_code_version().encode():
+        return None
+    row_hashes_path = get_row_hashes_path(cache_path)
+    row_hashes_metadata = read_columnar_metadata(row_hashes_path)
+    if row_hashes_metadata is None or row_hashes_metadata.get(b'source_hash') != metadata[b'source_hash']:
+        return None
+    return dict(
+        source_stat=metadata[b'source_stat'].decode(),
+        source_hash=metadata[b'source_hash'].decode(),
+        row_hashes=feather.read_table(row_hashes_path, memory_map=True).column('row_hash').to_numpy(),
+    )
+
+
+def _save_cache(cache_path, data, source_path, source_hash, row_hashes):
+    # хэши строк пишутся первыми: если запись данных прервется, source_hash не совпадет
+    write_columnar(
+        pd.DataFrame({'row_hash': row_hashes}),
+        get_row_hashes_path(cache_path),
+        metadata={b'source_hash': source_hash.encode()}
+    )
+    write_columnar(data, cache_path, metadata={
+        b'code_version': get_code_version().encode(),
+        b'source_stat': get_file_stat(source_path).encode(),
+        b'source_hash': source_hash.encode(),
+    })
+
+
+@profiled
+def load_preprocessed_data(source_path, cache_path=DEFAULT_CACHE_PATH, read_source=ingestion.read_source,
+                           columns=None, refresh=False):
+    """
+    Возвращает результат secondary_preprocess.preprocess для файла выгрузки
+
+    Кэш привязан к хэшу файла, таблиц правил и кода предобработки.
+    Если в выгрузку только дописаны строки, предобрабатываются только они.
+    Пока файл выгрузки не менялся, он не читается.
+
+    Parameters
+    ----------
+    source_path : str
+        Путь к выгрузке закупок
+    cache_path : str
+        Путь к файлу кэша
+    read_source : callable
+        Функция чтения выгрузки в pandas.DataFrame
+    columns : list
+        Колонки, которые нужно вернуть. По умолчанию все
+    refresh : bool
+        Не использовать кэш, предобработать всю выгрузку заново
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    cached = None if refresh else _load_cache_metadata(cache_path)
+    if cached is not None and cached['source_stat'] == get_file_stat(source_path):
+        return read_columnar(cache_path, columns)
+
+    source_hash = get_files_hash([source_path])
+    if cached is not None and cached['source_hash'] == source_hash:
+        data = read_columnar(cache_path)
+        _save_cache(cache_path, data, source_path, source_hash, cached['row_hashes'])
+        return data if columns is None else data[columns]
+
+    raw_data = read_source(source_path)
+    row_hashes = get_row_hashes(raw_data)
+    cached_rows = 0 if cached is None else len(cached['row_hashes'])
+    if cached is not None and np.array_equal(row_hashes[:cached_rows], cached['row_hashes']):
+        data = read_columnar(cache_path)
+        if cached_rows < len(raw_data):
+            data = pd.concat([data, preprocess(raw_data.iloc[cached_rows:].copy())])
+    else:
+        data = preprocess(raw_data)
+
+    _save_cache(cache_path, data, source_path, source_hash, row_hashes)
+    return data if columns is None else data[columns]
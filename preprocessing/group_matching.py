@@ -0,0 +1,51 @@
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+
+
+GROUP_RULES_PATH = os.path.join(os.path.dirname(__file__), 'group_rules.json')
+
+
+class GroupMatcher:
+    """
+    Определяет группу по началу очищенного наименования
+
+    Все правила собраны в одно регулярное выражение. Альтернативы идут
+    в обратном порядке, поэтому при нескольких совпадениях выигрывает
+    последнее правило таблицы.
+
+    Parameters
+    ----------
+    rules : list
+        Пары (регулярное выражение, группа). Если группа не указана,
+        группой считается само выражение
+    """
+
+    def __init__(self, rules):
+        self.groups = [group if group else pattern for pattern, group in rules]
+        self.pattern = re.compile('|'.join(
+            f'(?P<rule_{i}>{pattern})'
+            for i, (pattern, _) in reversed(list(enumerate(rules)))
+        ))
+
+    @classmethod
+    def from_file(cls, path=GROUP_RULES_PATH):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def match(self, name):
+        m = self.pattern.match(name)
+        if m is None:
+            return None
+        return self.groups[int(m.lastgroup[len('rule_'):])]
+
+    def __call__(self, names):
+        codes, unique_names = pd.factorize(names)
+        # код пропуска -1 указывает на последний элемент
+        groups = np.array([self.match(name) for name in unique_names] + [None], dtype=object)
+        return pd.Series(groups[codes], index=names.index, name=names.name)
+
+
+default_group_matcher = GroupMatcher.from_file()
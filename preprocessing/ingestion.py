@@ -0,0 +1,108 @@
+import glob
+import hashlib
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from profiling import profiled
+
+
+DEFAULT_COLUMNAR_DIR = 'cache'
+
+
+def get_files_hash(paths):
+    file_hash = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_file_stat(path):
+    stat = os.stat(path)
+    return f'{stat.st_size}-{stat.st_mtime_ns}'
+
+
+@profiled
+def write_columnar(df, path, metadata=None):
+    """
+    Атомарно сохраняет датафрейм в несжатый Feather, пригодный для memory mapping
+    """
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    if metadata:
+        table = table.replace_schema_metadata({**table.schema.metadata, **metadata})
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+
+
+def read_columnar_metadata(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).schema.metadata
+    except pa.ArrowInvalid:
+        return None
+
+
+def _get_index_columns(path):
+    with pa.memory_map(path) as source:
+        schema = pa.ipc.open_file(source).schema
+    return [name for name in schema.names if name.startswith('__index_level_')]
+
+
+@profiled
+def read_columnar(path, columns=None):
+    if columns is not None:
+        columns = list(columns) + _get_index_columns(path)
+    return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
+@profiled
+def read_excel_typed(source_path):
+    """
+    Читает выгрузку и приводит колонки к однородным типам
+
+    В "Дата поставки" встречаются и даты, и строки вида "дд.мм.гггг".
+    """
+    df = pd.read_excel(source_path)
+    delivery_dates = df['Дата поставки']
+    is_str = delivery_dates.apply(lambda s: isinstance(s, str))
+    df['Дата поставки'] = pd.to_datetime(delivery_dates.where(~is_str)).where(
+        ~is_str,
+        pd.to_datetime(delivery_dates.where(is_str), format='%d.%m.%Y')
+    )
+    return df
+
+
+@profiled
+def read_source(source_path, columns=None, columnar_dir=DEFAULT_COLUMNAR_DIR):
+    """
+    Читает выгрузку закупок через колоночную копию
+
+    Excel разбирается один раз, дальше читается Feather-файл с тем же
+    хэшем содержимого через memory mapping.
+
+    Parameters
+    ----------
+    source_path : str
+        Путь к выгрузке в формате xlsx
+    columns : list
+        Колонки, которые нужно прочитать. По умолчанию все
+    columnar_dir : str
+        Папка для колоночных копий
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    columnar_path = os.path.join(columnar_dir, f'{stem}.{get_files_hash([source_path])[:16]}.feather')
+    if read_columnar_metadata(columnar_path) is None:
+        for stale_path in glob.glob(os.path.join(glob.escape(columnar_dir), f'{glob.escape(stem)}.*.feather')):
+            os.remove(stale_path)
+        write_columnar(read_excel_typed(source_path), columnar_path)
+    return read_columnar(columnar_path, columns)
@@ -0,0 +1,141 @@
+"""
+Макроэкономические показатели из "ini_data" на подневной сетке индекса цен
+
+Каждый источник читается своим парсером в pandas.Series с индексом дат,
+ряды выравниваются на сетку convert_day_changes_to_index и заполняются
+последним известным значением. Результат кэшируется в Feather и
+пересчитывается при изменении файлов источников, этого модуля или сетки.
+
+"cbr rates" и "usd rates history" читаются из CSV: те же данные лежат в xlsb,
+но для них нужен pyxlsb. Готовые "all_indices*.csv" не используются.
+"""
+import os
+import pandas as pd
+from predictions.price_indexing.construction import MAX_DEFAULT_DATE, MIN_DEFAULT_DATE
+from profiling import profiled
+from .ingestion import get_files_hash, read_columnar, read_columnar_metadata, write_columnar
+
+
+DEFAULT_DATA_DIR = 'ini_data'
+DEFAULT_CACHE_PATH = 'cache/macro_indicators.feather'
+
+
+def read_cbr_rates(path):
+    """
+    Ключевая ставка ЦБ, %, с даты установления
+    """
+    df = pd.read_csv(path, sep=';', decimal=',', encoding='cp1251').dropna()
+    dates = pd.to_datetime(df.iloc[:, 0], format='%d.%m.%Y')
+    return pd.Series(df.iloc[:, 1].values, index=dates.values, name='rate')
+
+
+def read_usd_rates(path):
+    """
+    Курс доллара ЦБ, руб.
+    """
+    df = pd.read_csv(path, sep=';', decimal=',', encoding='utf-8-sig').dropna()
+    dates = pd.to_datetime(df['Дата'], format='%d.%m.%Y')
+    return pd.Series(df['Курс'].values, index=dates.values, name='usd')
+
+
+def read_gdp(path):
+    """
+    ВВП, млрд руб. в текущих ценах, с первого дня квартала
+    """
+    df = pd.read_excel(path, engine='xlrd').dropna()
+    dates = pd.to_datetime(dict(year=df['Год'], month=(df['Квартал'] - 1) * 3 + 1, day=1))
+    return pd.Series(df.iloc[:, 2].values, index=dates.values, name='gdp')
+
+
+def read_processing_index(path):
+    """
+    Индекс цен перерабатывающей промышленности к предыдущему месяцу, %, с первого дня месяца
+    """
+    df = pd.read_excel(path, engine='openpyxl').dropna()
+    dates = pd.to_datetime(dict(year=df['Год'], month=df['Месяц'], day=1))
+    return pd.Series(df['Значение'].values, index=dates.values, name='processing_idx')
+
+
+def read_brent(path):
+    """
+    Цена нефти Brent, $ за баррель
+    """
+    df = pd.read_excel(path, engine='openpyxl').dropna()
+    return pd.Series(df['Значение'].values, index=pd.to_datetime(df['Дата']).values, name='oil')
+
+
+def read_steel_index(path):
+    """
+    NYSE American Steel Index, цена закрытия
+    """
+    df = pd.read_csv(path, skipinitialspace=True).dropna()
+    return pd.Series(df['Close'].values, index=pd.to_datetime(df['Date'], format='%m/%d/%y').values, name='steel')
+
+
+SOURCES = [
+    ('cbr rates.csv', read_cbr_rates),
+    ('usd rates history.csv', read_usd_rates),
+    ('GDP quarterly.xls', read_gdp),
+    ('индекс цен перерабатывающей промышленности.xlsx', read_processing_index),
+    ('нефть-brent.xlsx', read_brent),
+    ('HistoricalPrices NYSE American Steel Index.csv', read_steel_index),
+]
+
+
+def align_to_daily_grid(indicators, min_date=MIN_DEFAULT_DATE, max_date=MAX_DEFAULT_DATE):
+    """
+    Выравнивает ряды на подневную сетку
+
+    Значение действует до следующего наблюдения, в том числе наблюдения до min_date.
+    После последнего наблюдения ряд продолжается последним значением.
+
+    Parameters
+    ----------
+    indicators : list
+        Ряды pandas.Series с индексом дат
+
+    Returns
+    -------
+    pandas.DataFrame
+        Колонки float64 с именами рядов и индексом "date"
+    """
+    dates = pd.date_range(min_date, max_date, freq='D', name='date')
+    columns = {}
+    for indicator in indicators:
+        indicator = indicator[~indicator.index.duplicated(keep='last')].sort_index().astype(float)
+        columns[indicator.name] = indicator.reindex(dates.union(indicator.index)).ffill().reindex(dates)
+    return pd.DataFrame(columns, index=dates)
+
+
+@profiled
+def load_macro_indicators(data_dir=DEFAULT_DATA_DIR,
+                          cache_path=DEFAULT_CACHE_PATH,
+                          min_date=MIN_DEFAULT_DATE,
+                          max_date=MAX_DEFAULT_DATE,
+                          columns=None):
+    """
+    Возвращает показатели на подневной сетке, читая источники только при изменениях
+
+    Parameters
+    ----------
+    data_dir : str
+        Каталог с файлами источников
+    cache_path : str
+        Путь к файлу кэша
+    min_date, max_date : datetime.date
+        Границы сетки, по умолчанию как у convert_day_changes_to_index
+    columns : list
+        Колонки, которые нужно вернуть: "rate", "usd", "gdp", "processing_idx", "oil", "steel". По умолчанию все
+
+    Returns
+    -------
+    pandas.DataFrame
+        Колонки float64 с индексом "date"
+    """
+    paths = [os.path.join(data_dir, file_name) for file_name, _ in SOURCES]
+    version = f'{get_files_hash(paths + [__file__])} {min_date.isoformat()} {max_date.isoformat()}'
+    metadata = read_columnar_metadata(cache_path)
+    if metadata is None or metadata.get(b'version') != version.encode():
+        indicators = align_to_daily_grid([read(path) for path, (_, read) in zip(paths, SOURCES)], min_date, max_date)
+        write_columnar(indicators, cache_path, {b'version': version.encode()})
+    return read_columnar(cache_path, None if columns is None else ['date', *columns])
@@ -0,0 +1,45 @@
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+
+
+SUBSTITUTIONS_PATH = os.path.join(os.path.dirname(__file__), 'name_substitutions.json')
+
+
+class NameNormalizer:
+    """
+    Приводит наименования к единому виду
+
+    Правила замены компилируются один раз и применяются по порядку
+    только к уникальным наименованиям. Пропуски остаются пропусками.
+
+    Parameters
+    ----------
+    substitutions : list
+        Пары (регулярное выражение, замена)
+    """
+
+    def __init__(self, substitutions):
+        self.substitutions = [(re.compile(pattern), replacement) for pattern, replacement in substitutions]
+
+    @classmethod
+    def from_file(cls, path=SUBSTITUTIONS_PATH):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def normalize(self, name):
+        name = name.lower().strip().replace("  ", "").replace('.', '-')
+        for pattern, replacement in self.substitutions:
+            name = pattern.sub(replacement, name)
+        return name
+
+    def __call__(self, names):
+        codes, unique_names = pd.factorize(names)
+        # код пропуска -1 указывает на последний элемент
+        normalized_names = np.array([self.normalize(name) for name in unique_names] + [np.nan], dtype=object)
+        return pd.Series(normalized_names[codes], index=names.index, name=names.name)
+
+
+default_normalizer = NameNormalizer.from_file()
@@ -1,7 +1,9 @@
 from .preprocess import preprocess as primary_preprocess
 import numpy as np
+from profiling import profiled
 
 
+@profiled
 def preprocess(data):
     data = primary_preprocess(data)
     data = data.copy()
@@ -0,0 +1,267 @@
+"""
+Прогноз цен для больших таблиц заказов по частям
+
+    python -m price_orders orders.xlsx priced.csv --n-jobs 4 --chunk-size 50000
+
+Входной файл (CSV, Parquet, xlsx) читается частями, наименования приводятся
+к виду модели через preprocess_name, части прогнозируются в пуле процессов
+и дописываются в выходной файл (CSV, Parquet) по порядку. В памяти
+одновременно не больше 2 * n_jobs частей.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import itertools
+import os
+import sys
+import time
+import joblib
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from predictions.price_indexing.artifact import load_model, read_artifact_metadata
+from prediction_service import DEFAULT_MODEL_PATH, get_model_names
+
+
+DEFAULT_CHUNK_SIZE = 50_000
+PRICE_COLUMN = 'predicted_price'
+
+_model = None
+
+
+def load_any_model(path):
+    """
+    Артефакт модели индексации цен или модель scikit-learn, сохраненная joblib.dump
+    """
+    if read_artifact_metadata(path) is not None:
+        return load_model(path)
+    return joblib.load(path)
+
+
+def get_total_rows(path):
+    """
+    Количество строк, если его можно узнать без чтения файла, иначе None
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.parquet':
+        return pq.ParquetFile(path).metadata.num_rows
+    if extension == '.xlsx':
+        workbook = openpyxl.load_workbook(path, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        return max_row - 1 if max_row else None
+    return None
+
+
+def _read_xlsx_chunks(path, chunk_size):
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        columns = next(rows)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        workbook.close()
+
+
+def read_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        # колонки как текст, иначе их типы зависят от содержимого каждой части
+        return pd.read_csv(path, chunksize=chunk_size, dtype=str)
+    if extension == '.parquet':
+        return (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size))
+    if extension == '.xlsx':
+        return _read_xlsx_chunks(path, chunk_size)
+    raise ValueError(f'Unsupported input format {extension}, expected .csv, .parquet or .xlsx')
+
+
+def get_input_schema(path):
+    """
+    Схема колонок входного файла, если она задана в нем самом (Parquet), иначе None
+    """
+    if os.path.splitext(path)[1].lower() == '.parquet':
+        return pq.ParquetFile(path).schema_arrow
+    return None
+
+
+class ChunkWriter:
+    """
+    Дописывает части в CSV или Parquet
+
+    Схема Parquet фиксируется до записи первой части: колонки input_schema
+    сохраняют свои типы, остальные входные колонки пишутся строками,
+    PRICE_COLUMN - float64. Поэтому тип колонки не зависит от того,
+    что попало в первую часть.
+
+    Parameters
+    ----------
+    path : str
+        Выходной файл .csv или .parquet
+    input_schema : pyarrow.Schema
+        Схема входного файла, см. get_input_schema
+    """
+
+    def __init__(self, path, input_schema=None):
+        self.path = path
+        self.extension = os.path.splitext(path)[1].lower()
+        if self.extension not in ('.csv', '.parquet'):
+            raise ValueError(f'Unsupported output format {self.extension}, expected .csv or .parquet')
+        self.input_schema = input_schema
+        self._parquet_writer = None
+        self._csv_header = True
+
+    def _get_schema(self, chunk):
+        fields = []
+        for column in chunk.columns:
+            if column == PRICE_COLUMN:
+                fields.append(pa.field(column, pa.float64()))
+            elif self.input_schema is not None and column in self.input_schema.names:
+                fields.append(self.input_schema.field(column))
+            else:
+                fields.append(pa.field(column, pa.string()))
+        return pa.schema(fields)
+
+    def write(self, chunk):
+        if self.extension == '.csv':
+            chunk.to_csv(self.path, mode='w' if self._csv_header else 'a', header=self._csv_header, index=False)
+            self._csv_header = False
+            return
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self.path, self._get_schema(chunk))
+        schema = self._parquet_writer.schema
+        chunk = chunk.copy()
+        for field in schema:
+            if pa.types.is_string(field.type):
+                values = chunk[field.name]
+                chunk[field.name] = values.astype(object).where(values.isnull(), values.astype(str))
+        self._parquet_writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def _init_worker(model_path):
+    global _model
+    _model = load_any_model(model_path)
+
+
+def predict_chunk(chunk, name_column, date_column, default_date, raw_names=False):
+    """
+    Прогноз цен для части таблицы моделью процесса, загруженной _init_worker
+
+    Даты, которых нет или которые не разбираются, заменяются на default_date.
+    """
+    names = chunk[name_column].astype(object).where(chunk[name_column].notnull(), '')
+    names = names.astype(str) if raw_names else get_model_names(names.astype(str).values)
+    dates = pd.Series(pd.NaT, index=chunk.index, dtype='datetime64[ns]')
+    if date_column in chunk:
+        dates = pd.to_datetime(chunk[date_column], errors='coerce', dayfirst=True)
+    x = pd.DataFrame({
+        'name': names.values,
+        'cleaned_name': names.values,
+        'order_date': dates.fillna(pd.Timestamp(default_date)).values,
+    })
+    chunk = chunk.copy()
+    chunk[PRICE_COLUMN] = pd.to_numeric(pd.Series(_model.predict(x)), errors='coerce').values
+    return chunk
+
+
+def price_orders(input_path,
+                 output_path,
+                 model_path=DEFAULT_MODEL_PATH,
+                 name_column='Наименование',
+                 date_column='Дата заказа',
+                 default_date=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE,
+                 n_jobs=1,
+                 raw_names=False,
+                 progress=sys.stderr):
+    """
+    Прогнозирует цены для таблицы заказов и возвращает количество обработанных строк
+
+    Parameters
+    ----------
+    input_path : str
+        Таблица заказов .csv, .parquet или .xlsx
+    output_path : str
+        Результат .csv или .parquet: колонки входной таблицы и PRICE_COLUMN
+    model_path : str
+        Артефакт модели индексации цен или модель, сохраненная joblib.dump
+    name_column, date_column : str
+        Колонки наименования и даты заказа
+    default_date : datetime.date
+        Дата для строк без даты заказа, по умолчанию сегодня
+    chunk_size : int
+        Количество строк в части
+    n_jobs : int
+        Количество процессов
+    raw_names : bool
+        Передавать наименования модели как есть, без preprocess_name
+    progress : file
+        Куда писать ход обработки, None - не писать
+    """
+    default_date = default_date or datetime.date.today()
+    total_rows = get_total_rows(input_path)
+    writer = ChunkWriter(output_path, get_input_schema(input_path))
+    rows = 0
+    start = time.perf_counter()
+
+    def report(chunk):
+        nonlocal rows
+        writer.write(chunk)
+        rows += len(chunk)
+        if progress is not None:
+            elapsed = time.perf_counter() - start
+            done = f'{rows}/{total_rows} ({rows / total_rows * 100:.01f}%)' if total_rows else f'{rows}'
+            print(f'{done} rows, {rows / elapsed:,.0f} rows/s, {elapsed:.01f} s', file=progress, flush=True)
+
+    args = (name_column, date_column, default_date, raw_names)
+    try:
+        if n_jobs == 1:
+            _init_worker(model_path)
+            for chunk in read_chunks(input_path, chunk_size):
+                report(predict_chunk(chunk, *args))
+            return rows
+
+        with concurrent.futures.ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=(model_path,)) as pool:
+            pending = []
+            for chunk in read_chunks(input_path, chunk_size):
+                pending.append(pool.submit(predict_chunk, chunk, *args))
+                if len(pending) >= 2 * n_jobs:
+                    report(pending.pop(0).result())
+            for future in pending:
+                report(future.result())
+        return rows
+    finally:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Прогноз цен для таблицы заказов по частям')
+    parser.add_argument('input', help='таблица заказов .csv, .parquet или .xlsx')
+    parser.add_argument('output', help='результат .csv или .parquet')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH,
+                        help='артефакт модели индексации цен или модель, сохраненная joblib.dump')
+    parser.add_argument('--name-column', default='Наименование')
+    parser.add_argument('--date-column', default='Дата заказа')
+    parser.add_argument('--date', type=datetime.date.fromisoformat, help='дата для строк без даты заказа, по умолчанию сегодня')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--n-jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--raw-names', action='store_true', help='не нормализовать наименования')
+    args = parser.parse_args()
+    price_orders(
+        args.input, args.output, args.model, args.name_column, args.date_column, args.date,
+        args.chunk_size, args.n_jobs, args.raw_names,
+    )
+
+
+if __name__ == '__main__':
+    main()
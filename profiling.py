@@ -0,0 +1,149 @@
+"""
+Замеры этапов конвейера: время, количество строк и пик памяти
+
+Включаются переменной окружения PRICE_MONITORING_PROFILE=1 до импорта модулей.
+Без нее декоратор profiled возвращает функцию без изменений,
+а profile_stage - пустой контекстный менеджер.
+
+Замеры пишутся в общий список процесса, а внутри recording - в отдельный
+список потока, чтобы параллельные запуски не смешивали и не стирали замеры друг друга.
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+ENV_VAR = 'PRICE_MONITORING_PROFILE'
+ENABLED = os.environ.get(ENV_VAR, '') not in ('', '0')
+
+_records = []
+_local = threading.local()
+_disabled_stage = contextlib.nullcontext()
+
+
+def _get_rows(values):
+    for value in values:
+        shape = getattr(value, 'shape', None)
+        if shape:
+            return shape[0]
+    return None
+
+
+def _get_stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _get_records():
+    records = getattr(_local, 'records', None)
+    return _records if records is None else records
+
+
+@contextlib.contextmanager
+def _profile_stage(stage, rows=None):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    stack = _get_stack()
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+    tracemalloc.reset_peak()
+    frame = dict(start_memory=current, peak=current)
+    stack.append(frame)
+    record = dict(stage=stage, depth=len(stack) - 1, rows=rows)
+    _get_records().append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        record.update(seconds=seconds, peak_memory_mb=(peak - frame['start_memory']) / 2 ** 20)
+
+
+def profile_stage(stage, rows=None):
+    """
+    Контекстный менеджер замера блока кода
+
+    Количество строк можно передать сразу или записать в record['rows'] внутри блока.
+
+    Examples
+    --------
+    >>> with profile_stage('read_excel') as record:
+    >>>     df = pd.read_excel(path)
+    >>>     record['rows'] = len(df)
+    """
+    if not ENABLED:
+        return _disabled_stage
+    return _profile_stage(stage, rows)
+
+
+def profiled(function=None, stage=None):
+    """
+    Декоратор замера функции
+
+    Количество строк - длина первого аргумента-таблицы или массива (pandas, numpy),
+    а если такого нет - длина результата.
+    """
+    if function is None:
+        return functools.partial(profiled, stage=stage)
+    if not ENABLED:
+        return function
+    stage = stage or f'{function.__module__}.{function.__qualname__}'
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with _profile_stage(stage, _get_rows(args)) as record:
+            result = function(*args, **kwargs)
+            if record['rows'] is None:
+                record['rows'] = _get_rows([result])
+            return result
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def recording():
+    """
+    Собирает замеры текущего потока внутри блока в отдельный список
+
+    Examples
+    --------
+    >>> with recording() as records:
+    >>>     model.fit(x, y)
+    >>> to_json(records)
+    """
+    previous = getattr(_local, 'records', None)
+    _local.records = records = []
+    try:
+        yield records
+    finally:
+        _local.records = previous
+
+
+def get_records():
+    """
+    Замеры в порядке начала этапов: "stage", "depth", "rows", "seconds", "peak_memory_mb"
+    """
+    return list(_get_records())
+
+
+def reset():
+    _get_records().clear()
+
+
+def to_json(records=None):
+    return json.dumps(get_records() if records is None else records, ensure_ascii=False, indent=2)
+
+
+def export_json(path, records=None):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(to_json(records))
@@ -1,26 +1,137 @@
-from .metrics import rmspe
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from .metrics import mape, rmspe
 
 
-def check_model(model, train_data, test_data, title='Some model'):
-    print('Model:', title)
+def get_default_models():
+    from predictions.dumb_model import Model as DumbModel
+    from predictions.last_record_model import Model as LastRecordModel
+    from predictions.price_indexing.model import Model as PriceIndexingModel
+    from predictions.scaled_input.model import Model as ScaledInputModel
+
+    return {
+        'dumb_model': DumbModel(),
+        'last_record_model': LastRecordModel(),
+        'scaled_input': ScaledInputModel(),
+        'price_indexing': PriceIndexingModel(),
+    }
+
+
+def evaluate_model(model, train_data, test_data):
+    """
+    Обучает модель и оценивает ее на тестовых данных
+
+    Returns
+    -------
+    dict
+        "coverage" - доля тестовых записей с прогнозом,
+        "rmspe", "mape" - ошибки на записях с прогнозом,
+        "fit_time", "predict_time" - время обучения и прогноза в секундах
+    """
+    start = time.perf_counter()
     model.fit(train_data.drop('price', axis=1), train_data['price'])
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
     y_pred = model.predict(test_data.drop('price', axis=1))
-    y_pred_not_na_indexing = [item is not None for item in y_pred]
-    print('Predicted:', f'{sum(y_pred_not_na_indexing) / len(y_pred) * 100:.02f}%')
+    predict_time = time.perf_counter() - start
+
+    y_pred = np.array(y_pred, dtype=float)
+    y_pred_not_na_indexing = ~np.isnan(y_pred)
     y_pred_not_na = y_pred[y_pred_not_na_indexing]
-    y_true_not_na = test_data['price'][y_pred_not_na_indexing]
-    rmspe_value = rmspe(y_true_not_na, y_pred_not_na)
-    print(f'RMSPE: {rmspe_value * 100:.02f}%')
+    y_true_not_na = test_data['price'].values[y_pred_not_na_indexing]
+    has_predictions = len(y_pred_not_na) > 0
+    return dict(
+        coverage=y_pred_not_na_indexing.mean() if len(y_pred) else np.nan,
+        rmspe=rmspe(y_true_not_na, y_pred_not_na) if has_predictions else np.nan,
+        mape=mape(y_true_not_na, y_pred_not_na) if has_predictions else np.nan,
+        fit_time=fit_time,
+        predict_time=predict_time,
+    )
+
+
+def check_model(model, train_data, test_data, title='Some model'):
+    print('Model:', title)
+    result = evaluate_model(model, train_data, test_data)
+    print('Predicted:', f'{result["coverage"] * 100:.02f}%')
+    print(f'RMSPE: {result["rmspe"] * 100:.02f}%')
+
+
+def get_rolling_origin_cutoffs(data, n_folds=4, test_days=180):
+    """
+    Даты начала тестовых периодов: n_folds последовательных периодов по test_days дней,
+    последний заканчивается последней датой заказа
+    """
+    last_date = pd.to_datetime(data['order_date']).max().normalize() + pd.Timedelta(days=1)
+    return [last_date - pd.Timedelta(days=test_days * i) for i in range(n_folds, 0, -1)]
+
+
+def _evaluate_fold(title, model, fold, cutoff, train_data, test_data):
+    return dict(
+        model=title,
+        fold=fold,
+        cutoff=cutoff,
+        train_size=len(train_data),
+        test_size=len(test_data),
+        **evaluate_model(model, train_data, test_data),
+    )
+
+
+def backtest(data, models=None, cutoffs=None, test_days=180, n_folds=4, n_jobs=1):
+    """
+    Оценка моделей со скользящей точкой отсечения
+
+    Для каждой даты отсечения модель обучается на заказах до нее
+    и проверяется на заказах следующих test_days дней. Пары модель - период
+    считаются параллельно в n_jobs процессах, данные предобрабатываются
+    заранее один раз, например через preprocessing.cache.load_preprocessed_data.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Результат secondary_preprocess.preprocess
+    models : dict
+        Модели по названиям, по умолчанию get_default_models(). Каждая модель клонируется
+    cutoffs : list
+        Даты отсечения, по умолчанию get_rolling_origin_cutoffs(data, n_folds, test_days)
+    test_days : int
+        Длина тестового периода в днях
+    n_folds : int
+        Количество периодов, если не заданы cutoffs
+    n_jobs : int
+        Количество процессов
+
+    Returns
+    -------
+    pandas.DataFrame
+        Строка на каждую пару модель - период с колонками "model", "fold", "cutoff",
+        "train_size", "test_size", "coverage", "rmspe", "mape", "fit_time", "predict_time"
+    """
+    if models is None:
+        models = get_default_models()
+    data = data[~data['order_date'].isna()]
+    if cutoffs is None:
+        cutoffs = get_rolling_origin_cutoffs(data, n_folds, test_days)
+    order_dates = pd.to_datetime(data['order_date'])
+
+    tasks = []
+    for fold, cutoff in enumerate(pd.to_datetime(cutoffs)):
+        train_data = data[order_dates < cutoff]
+        test_data = data[(order_dates >= cutoff) & (order_dates < cutoff + pd.Timedelta(days=test_days))]
+        for title, model in models.items():
+            tasks.append(delayed(_evaluate_fold)(title, clone(model), fold, cutoff, train_data, test_data))
+
+    return pd.DataFrame(Parallel(n_jobs=n_jobs)(tasks))
 
 
 def usage_example():
     from predictions.last_record_model import Model as LastRecordModel
     import datetime
-    import pandas as pd
-    from preprocessing.secondary_preprocess import preprocess
+    from preprocessing.cache import load_preprocessed_data
 
-    data = pd.read_excel('../ini_data/datamon.xlsx')
-    data = preprocess(data)
+    data = load_preprocessed_data('../ini_data/datamon.xlsx')
     data = data[~data['order_date'].isna()]
     first_test_date = datetime.date(2021, 1, 1)
     train_data = data[data['order_date'] < first_test_date]
@@ -30,3 +141,6 @@ def usage_example():
     print('Test size:', len(test_data))
 
     check_model(LastRecordModel(), train_data, test_data, title='Just last available price')
+
+    results = backtest(data, n_jobs=-1)
+    print(results.groupby('model')[['coverage', 'rmspe', 'mape', 'fit_time', 'predict_time']].mean())